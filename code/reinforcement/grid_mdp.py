@@ -6,12 +6,16 @@ Created on Mar 13, 2016
 
 from argparse import ArgumentParser, RawDescriptionHelpFormatter, ArgumentDefaultsHelpFormatter
 from textwrap import dedent
-from itertools import *
 from progressbar import ProgressBar
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve, gmres
+from multiprocessing import Pool
+import heapq
+import itertools
 import random
-import math
 import sys
+import time
 
 def parse():
     '''
@@ -27,241 +31,429 @@ def parse():
     parser.add_argument('-g', '--goal', type=int, default=1, help='Goal reward')
     parser.add_argument('-p', '--penalty', type=int, default=-1, help='Penalty')
     parser.add_argument('-d', '--discount', type=float, default=0.95, help='Discount')
+    parser.add_argument('-s', '--solver', default='policy',
+                        choices=['policy', 'value', 'gauss-seidel', 'prioritized'], help='Solver')
+    parser.add_argument('-e', '--evaluation', default='direct', choices=['direct', 'gmres', 'sweeps'],
+                        help='Policy evaluation method (policy iteration only)')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Solve the MDPs of all combinations of the discounts, goals and penalties '
+                             'below with batched value iteration')
+    parser.add_argument('--discounts', type=float, nargs='+', help='Discounts to sweep (default: --discount)')
+    parser.add_argument('--goals', type=int, nargs='+', help='Goal rewards to sweep (default: --goal)')
+    parser.add_argument('--penalties', type=int, nargs='+', help='Penalties to sweep (default: --penalty)')
+    parser.add_argument('-b', '--batch-size', type=int, default=8, help='MDPs solved together per batch')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', default='sweep.tsv', help='Results table of the sweep')
     
     return vars(parser.parse_args())
     
-def build_environment(nrow=3, ncol=4, goal_reward=1, penalty=-1):
+## The set of actions
+## Actions = north, south, east, west
+actions = ['N', 'S', 'E', 'W']
+
+## The transition probabilities
+transition = {}
+transition['N'] = [0.8, 0, 0.1, 0.1] # north, south, east, west
+transition['S'] = [0, 0.8, 0.1, 0.1]
+transition['E'] = [0.1, 0.1, 0.8, 0]
+transition['W'] = [0.1, 0.1, 0, 0.8]
+
+## The value of an action on the grid
+action_values = {}
+action_values['N'] = [-1, 0] # x, y
+action_values['S'] = [1, 0]
+action_values['E'] = [0, 1]
+action_values['W'] = [0, -1]
+
+class GridEnvironment(object):
     '''
-    Sets up the MDP environment.
+    The MDP environment, compiled once. States are the grid cells, numbered in row-major
+    order (state_index/state convert between (row, col) tuples and ints).
+
+    - rewards, values: (nrow, ncol) rewards and initial values, NaN at the wall
+    - state_rewards, initial_values: the same as flat [S] vectors, 0 at the wall (the
+      wall is never a successor, so it drops out of every backup)
+    - successors: [S, A] state reached from each state by each move in actions
+    - probabilities: [A, A] probability of each move given the action taken
+    - terminal, wall, free: [S] masks of the goal and trap, of the wall, and of the
+      states whose value is to be solved for
     '''
-    ## Set the initial rewards
-    global rewards
-    rewards = np.zeros(shape=(nrow, ncol))
+    def __init__(self, nrow=3, ncol=4, goal_reward=1, penalty=-1):
+        self.nrow = nrow
+        self.ncol = ncol
+        self.num_states = nrow * ncol
+        ## The goal state
+        self.goal_state = (0, ncol - 1)
+        ## The trap state
+        self.trap_state = (1, ncol - 1)
+        ## Coordinates of the 'wall'
+        self.wall_state = (int(nrow / 2), int(ncol / 2) - 1)
+        
+        ## Set the reward values
+        self.rewards = np.zeros(shape=(nrow, ncol))
+        self.rewards[self.goal_state] = goal_reward
+        self.rewards[self.trap_state] = penalty
+        self.rewards[self.wall_state] = None
+        ## Set the initial values
+        self.values = np.zeros(shape=(nrow, ncol))
+        self.values[self.wall_state] = None
+        self.values[self.goal_state] = goal_reward
+        self.values[self.trap_state] = penalty
+        self.state_rewards = np.nan_to_num(self.rewards.ravel())
+        self.initial_values = np.nan_to_num(self.values.ravel())
+        
+        self.terminal = np.zeros(shape=self.num_states, dtype=bool)
+        self.terminal[[self.state_index(self.goal_state), self.state_index(self.trap_state)]] = True
+        self.wall = np.zeros(shape=self.num_states, dtype=bool)
+        self.wall[self.state_index(self.wall_state)] = True
+        self.free = ~(self.terminal | self.wall)
+        
+        index = np.arange(self.num_states)
+        rows, cols = np.divmod(index, ncol)
+        self.successors = np.empty(shape=(self.num_states, len(actions)), dtype=np.intp)
+        for m, move in enumerate(actions):
+            ## Constrained by the edge of the grid
+            next_rows = np.clip(rows + action_values[move][0], 0, nrow - 1)
+            next_cols = np.clip(cols + action_values[move][1], 0, ncol - 1)
+            next_idx = next_rows * ncol + next_cols
+            ## Hit the wall - no change in state
+            hit_wall = self.wall[next_idx]
+            next_idx[hit_wall] = index[hit_wall]
+            ## Reached the goal or the trap - no change in state
+            next_idx[self.terminal] = index[self.terminal]
+            self.successors[:, m] = next_idx
+        self.probabilities = np.array([transition[action] for action in actions], dtype=np.float64)
     
-    ## The set of states are the grid cells
-    global states 
-    states = product(range(nrow), range(ncol))
-    states = list(states) # convert iterator to list
+    def state_index(self, state):
+        return state[0] * self.ncol + state[1]
     
-    ## The goal state
-    goal_row = 0
-    goal_col = max(states)[1]
-    global goal_state
-    goal_state = (goal_row, goal_col)
-    rewards[goal_state] = goal_reward
+    def state(self, index):
+        return divmod(index, self.ncol)
     
-    ## The trap state
-    trap_row = 1
-    trap_col = max(states)[1]
-    global trap_state
-    trap_state = (trap_row, trap_col)
-    rewards[trap_state] = penalty
+    def act(self, cur_state, action):
+        '''
+        Moves the agent through the states based on action taken.
+        '''
+        if cur_state == self.wall_state:
+            sys.exit('Cannot enter wall state!')
+        return self.state(self.successors[self.state_index(cur_state), actions.index(action)])
     
-    ## Coordinates of the 'wall'
-    wall_row = int(nrow / 2)
-    wall_col = int(ncol / 2) - 1
-    global wall_state
-    wall_state = (wall_row, wall_col)
-    ## Set the reward values
-    rewards[wall_state] = None
+    def q_values(self, state_values, gamma=1):
+        '''
+        Bellman backup of all states at once: the [S, A] Q-function given the values of
+        the successor states.
+        '''
+        return self.state_rewards[:, None] + gamma * np.dot(state_values[self.successors],
+                                                            self.probabilities.T)
     
-    ## Set the initial values
-    global values 
-    values = np.zeros(shape=(nrow, ncol))
-    values[wall_state] = None
-    values[goal_state] = goal_reward
-    values[trap_state] = penalty
+    def transition_matrix(self, policy):
+        '''
+        Computes the sparse (|S|x|S|) CSR transition matrix of the given policy, an array
+        holding the index of the action taken in every state, in one vectorized pass. The
+        goal and trap rows are self-loops and the wall row is empty.
+        '''
+        data = self.probabilities[policy]
+        data[self.wall] = 0
+        rows = np.repeat(np.arange(self.num_states), len(actions))
+        ## Moves ending in the same state (e.g. bumping into an edge) are summed up
+        transition_matrix = sparse.coo_matrix((data.ravel(), (rows, self.successors.ravel())),
+                                              shape=(self.num_states, self.num_states)).tocsr()
+        transition_matrix.eliminate_zeros()
+        return transition_matrix
     
-    ## The set of actions
-    global actions
-    actions = ['N', 'S', 'E', 'W']
+    def predecessors(self):
+        '''
+        Predecessor index in CSR form: the states that can move into state s are
+        indices[indptr[s]:indptr[s + 1]] (self-loops excluded).
+        '''
+        sources = np.repeat(np.arange(self.num_states), len(actions))
+        targets = self.successors.ravel()
+        moves = targets != sources
+        graph = sparse.coo_matrix((np.ones(np.count_nonzero(moves)), (targets[moves], sources[moves])),
+                                  shape=(self.num_states, self.num_states)).tocsr()
+        return graph.indptr, graph.indices
     
-    ## Create the transition probabilities
-    ## Actions = north, south, east, west
-    global transition 
-    transition = {}
-    transition['N'] = [0.8, 0, 0.1, 0.1] # north, south, east, west
-    transition['S'] = [0, 0.8, 0.1, 0.1]
-    transition['E'] = [0.1, 0.1, 0.8, 0]
-    transition['W'] = [0.1, 0.1, 0, 0.8]
+    def grid(self, state_values):
+        '''
+        Reshapes flat state values into the grid, with NaN at the wall.
+        '''
+        grid_values = state_values.reshape(self.nrow, self.ncol).copy()
+        grid_values[self.wall_state] = None
+        return grid_values
     
-    ## The value of an action on the grid
-    global action_values 
-    action_values = {}
-    action_values['N'] = [-1, 0] # x, y
-    action_values['S'] = [1, 0]
-    action_values['E'] = [0, 1]
-    action_values['W'] = [0, -1]
-        
-def act(cur_state, action):
+    def policy_matrix(self, policy):
+        '''
+        The (nrow, ncol) character matrix of a policy given as action indices, with '_'
+        at the goal, trap and wall.
+        '''
+        policy_matrix = np.chararray(shape=(self.nrow, self.ncol))
+        policy_matrix[:] = '_'
+        policy_matrix[self.free.reshape(self.nrow, self.ncol)] = np.array(actions)[policy[self.free]]
+        return policy_matrix
+
+def build_environment(nrow=3, ncol=4, goal_reward=1, penalty=-1):
     '''
-    Moves the agent through the states based on action taken.
+    Sets up the MDP environment.
     '''
-    if cur_state == wall_state:
-        sys.exit('Cannot enter wall state!')
-    
-    action_value = action_values[action]
-    next_state = cur_state
-    next_state = list(next_state) # convert from tuple to list
-    
-    ## Check if either goal or trap state has been reached
-    if (cur_state == goal_state) or (cur_state == trap_state):
-        ## Reached the goal or the trap - no change in state
-        return cur_state
-    ## Otherwise, update the state
-    next_row = cur_state[0] + action_value[0]
-    next_col = cur_state[1] + action_value[1]
-    
-    ## Constrained by the edge of the grid
-    next_state[0] = min(max(states)[0], max(0, next_row))
-    next_state[1] = min(max(states)[1], max(0, next_col))
-    next_state = tuple(next_state) # convert from list to tuple
-    if next_state == wall_state: # hit the wall - no change in state
-        next_state = cur_state
-    return next_state
+    return GridEnvironment(nrow, ncol, goal_reward, penalty)
 
-def bellman_update(state, action, gamma=1):
-    ## action = {'N', 'S', 'E', 'W'}
-    ## state: the current state
-    ## gamma: discount factor
-    trans_prob = transition[action]
-    q = [0] * len(trans_prob) # the Q-function
-    for i in range(len(trans_prob)):
-        if trans_prob[i] > 0:
-            prob_action = actions[i]
-            next_state = act(state, prob_action)
-            q[i] = trans_prob[i] * (rewards[state] + gamma * values[next_state])
-    return sum(q)
+def value_iteration(env, gamma=1, n_iter=1000):
+    '''
+    Implements the value iteration algorithm: each sweep backs up every state with a
+    few array operations over the successor table. Returns the policy, the values and
+    the number of state backups.
+    '''
+    state_values = env.initial_values
+    ## The threshold of different
+    epsilon = 1e-5
+    ## Define a progress bar
+    progress = ProgressBar(maxval=n_iter).start()
+    
+    for i in range(n_iter):
+        q = env.q_values(state_values, gamma)
+        ## Only the free cells are backed up; the goal and trap keep their values
+        new_values = np.where(env.free, q.max(1), state_values)
+        max_diff = np.max(np.abs(new_values - state_values))
+        state_values = new_values
+        if max_diff < epsilon:
+            progress.finish()
+            break
+        progress.update(i+1)
+    ## The greedy action (first one on ties) of the last sweep
+    backups = (i + 1) * np.count_nonzero(env.free)
+    return env.policy_matrix(np.argmax(q, 1)), env.grid(state_values), backups
 
-def value_iteration(nrow=3, ncol=4, goal_reward=1, penalty=-1,
-                    gamma=1, n_iter=1000):
-    ## Values of the previous iteration
-    prev_values = np.zeros(shape=(nrow, ncol))
-    prev_values[goal_state] = goal_reward
-    prev_values[trap_state] = penalty
-    prev_values[wall_state] = None
+def gauss_seidel(env, gamma=1, n_iter=1000):
+    '''
+    Value iteration with in-place (Gauss-Seidel) sweeps, so each backup already sees
+    the new values of the states updated before it in the sweep. Moves only reach
+    neighbouring cells, so with a red-black ordering all cells of one colour only
+    depend on cells of the other colour and each half-sweep is vectorized. Returns the
+    policy, the values and the number of state backups.
+    '''
+    state_values = env.initial_values.copy()
+    rows, cols = np.divmod(np.arange(env.num_states), env.ncol)
+    colours = [np.flatnonzero(env.free & ((rows + cols) % 2 == c)) for c in [0, 1]]
     ## The threshold of different
     epsilon = 1e-5
     ## Define a progress bar
     progress = ProgressBar(maxval=n_iter).start()
-    ## Create a policy matrix
-    policy = np.chararray(shape=(nrow, ncol))
-    policy[goal_state] = '_'
-    policy[trap_state] = '_'
-    policy[wall_state] = '_'
     
     for i in range(n_iter):
-        for state in states:
-            if state != goal_state and state != trap_state and state != wall_state:
-                q_values = [0] * len(actions)
-                counter = 0
-                for action in actions:
-                    q_values[counter] = bellman_update(state, action, gamma)
-                    counter += 1
-                max_q = max(q_values)
-                if math.isnan(max_q):
-                    sys.exit('max_q is nan!')
-                max_idx = q_values.index(max_q)
-                values[state] = max_q
-                policy[state] = actions[max_idx]
-                
-        diff = values - prev_values
-        max_diff = np.nanmax(abs(diff))
+        max_diff = 0.0
+        for states in colours:
+            q = env.state_rewards[states, None] + gamma * np.dot(state_values[env.successors[states]],
+                                                                  env.probabilities.T)
+            new_values = q.max(1)
+            if len(states) > 0:
+                max_diff = max(max_diff, np.max(np.abs(new_values - state_values[states])))
+            state_values[states] = new_values
         if max_diff < epsilon:
             progress.finish()
             break
-        prev_values[:] = values # make a shallow copy of the list so that it won't get updated
         progress.update(i+1)
-    return policy
+    backups = (i + 1) * np.count_nonzero(env.free)
+    policy = np.argmax(env.q_values(state_values, gamma), 1)
+    return env.policy_matrix(policy), env.grid(state_values), backups
+
+def prioritized_sweeping(env, gamma=1, n_iter=1000):
+    '''
+    Value iteration backing up one state at a time, always the one with the largest
+    Bellman error, from a priority queue. After a backup only the predecessors of the
+    state can have a new Bellman error, so only they are re-queued; states far from
+    the goal and trap are not touched until their successors change. Stops when no
+    Bellman error is above the threshold, or after n_iter backups per state. Returns
+    the policy, the values and the number of state backups, counting both the updates
+    and the full backups that recompute the Bellman errors of the predecessors.
+    '''
+    ## The threshold of different
+    epsilon = 1e-5
+    indptr, indices = env.predecessors()
+    ## Plain Python lists: this loop works on one state at a time
+    successors = env.successors.tolist()
+    probabilities = env.probabilities.tolist()
+    state_rewards = env.state_rewards.tolist()
+    free = env.free.tolist()
+    state_values = env.initial_values.tolist()
+    moves = range(len(actions))
+    
+    def backup(s):
+        next_values = [state_values[n] for n in successors[s]]
+        return state_rewards[s] + gamma * max(sum(p[m] * next_values[m] for m in moves)
+                                              for p in probabilities)
+    
+    ## Max-heap of (-Bellman error, state); stale entries are skipped when popped
+    error = np.abs(np.max(env.q_values(env.initial_values, gamma), 1) - env.initial_values)
+    error[~env.free] = 0
+    priority = error.tolist()
+    queue = [(-e, s) for s, e in enumerate(priority) if e >= epsilon]
+    heapq.heapify(queue)
+    backups = 0
+    max_backups = n_iter * np.count_nonzero(env.free)
+    while queue and backups < max_backups:
+        e, s = heapq.heappop(queue)
+        if -e != priority[s]:
+            continue
+        priority[s] = 0.0
+        state_values[s] = backup(s)
+        backups += 1
+        for p in indices[indptr[s]:indptr[s + 1]]:
+            if free[p]:
+                e = abs(backup(p) - state_values[p])
+                backups += 1
+                if e >= epsilon and e > priority[p]:
+                    priority[p] = e
+                    heapq.heappush(queue, (-e, p))
+    state_values = np.array(state_values)
+    policy = np.argmax(env.q_values(state_values, gamma), 1)
+    return env.policy_matrix(policy), env.grid(state_values), backups
 
-def get_transition_matrix(policy):
+def batched_value_iteration(env, gammas, goal_rewards, penalties, n_iter=1000):
     '''
-    Computes an (|S|x|S|) transition matrix for the give policy.
+    Value iteration of B MDPs at once, all on the grid of env and differing by their
+    discount, goal reward and penalty: values, rewards and discounts are stacked along
+    a leading batch axis, so each sweep is still a few array operations. An MDP stops
+    being updated once it has converged. Returns the [B, S] greedy policies (action
+    indices), the [B, S] values and the number of sweeps of each MDP.
     '''
-    transition_matrix = np.zeros(shape=(len(states), len(states)))
-    for state in states:
-        ## The probabilities of transition to the next states given the current state and action
-        if state != wall_state:
-            from_state_idx = states.index(state)
-            if state == goal_state or state == trap_state:
-                ## Always stay in the same state no matter what action
-                next_state_idx = from_state_idx
-                transition_matrix[from_state_idx, next_state_idx] = 1
-            else:
-                action = policy[state]
-                trans_prob = transition[action]
-                for i in range(len(trans_prob)):
-                    if trans_prob[i] > 0:
-                        prob_action = actions[i]
-                        next_state = act(state, prob_action)
-                        next_state_idx = states.index(next_state)
-                        if next_state == state: # stay the same
-                            prev_value = transition_matrix[from_state_idx, next_state_idx]
-                            transition_matrix[from_state_idx, next_state_idx] = prev_value + trans_prob[i]
-                        else:
-                            transition_matrix[from_state_idx, next_state_idx] = trans_prob[i]
+    gammas = np.asarray(gammas, dtype=np.float64)[:, None, None]
+    goal_idx = env.state_index(env.goal_state)
+    trap_idx = env.state_index(env.trap_state)
+    num_mdps = gammas.shape[0]
+    state_rewards = np.tile(env.state_rewards, (num_mdps, 1))
+    state_rewards[:, goal_idx] = goal_rewards
+    state_rewards[:, trap_idx] = penalties
+    state_values = np.tile(env.initial_values, (num_mdps, 1))
+    state_values[:, goal_idx] = goal_rewards
+    state_values[:, trap_idx] = penalties
+    ## The threshold of different
+    epsilon = 1e-5
+    active = np.ones(shape=num_mdps, dtype=bool)
+    iterations = np.zeros(shape=num_mdps, dtype=int)
     
-    return transition_matrix
+    for i in range(n_iter):
+        q = state_rewards[:, :, None] + gammas * np.dot(state_values[:, env.successors], env.probabilities.T)
+        ## Only the free cells of the unconverged MDPs are backed up
+        new_values = np.where(env.free & active[:, None], q.max(2), state_values)
+        max_diff = np.max(np.abs(new_values - state_values), 1)
+        state_values = new_values
+        iterations[active] = i + 1
+        active &= max_diff >= epsilon
+        if not active.any():
+            break
+    return np.argmax(q, 2), state_values, iterations
+
+def _solve_batch(task):
+    '''
+    Worker of sweep(): solves one batch of (discount, goal, penalty) MDPs.
+    '''
+    nrow, ncol, batch, n_iter = task
+    env = build_environment(nrow, ncol)
+    gammas, goal_rewards, penalties = zip(*batch)
+    policies, state_values, iterations = batched_value_iteration(env, gammas, goal_rewards, penalties, n_iter)
+    start_idx = env.state_index((nrow - 1, 0))
+    rows = []
+    for k, (gamma, goal_reward, penalty) in enumerate(batch):
+        policy = '|'.join(''.join(row) for row in env.policy_matrix(policies[k]))
+        rows.append((gamma, goal_reward, penalty, iterations[k], state_values[k, start_idx], policy))
+    return rows
+
+def sweep(nrow, ncol, gammas, goal_rewards, penalties, batch_size=8, processes=None, n_iter=1000):
+    '''
+    Solves the MDPs of all combinations of the discounts, goal rewards and penalties.
+    The combinations are split into batches of batch_size MDPs, solved together by
+    batched_value_iteration, and the batches are spread over a pool of processes.
+    Returns one row per MDP: discount, goal, penalty, sweeps, value of the bottom-left
+    start cell and the policy (rows separated by '|').
+    '''
+    combinations = list(itertools.product(gammas, goal_rewards, penalties))
+    tasks = [(nrow, ncol, combinations[k:k + batch_size], n_iter)
+             for k in xrange(0, len(combinations), batch_size)]
+    pool = Pool(processes)
+    try:
+        results = pool.map(_solve_batch, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return [row for rows in results for row in rows]
+
+def write_table(filename, rows):
+    '''
+    Writes the rows of sweep() as a tab-separated table.
+    '''
+    with open(filename, 'w') as f:
+        f.write('discount\tgoal\tpenalty\tsweeps\tstart_value\tpolicy\n')
+        for gamma, goal_reward, penalty, iterations, start_value, policy in rows:
+            f.write('%g\t%d\t%d\t%d\t%.6f\t%s\n' % (gamma, goal_reward, penalty, iterations,
+                                                       start_value, policy))
+
+def evaluate_policy(transition_matrix, state_rewards, gamma=1, evaluation='direct', x0=None,
+                    n_sweeps=20):
+    '''
+    Solves the linear equations (I - gamma * T) v = T' r for the values of a policy:
+    - 'direct': with a sparse direct solver
+    - 'gmres': iteratively, with restarted GMRES started from x0
+    - 'sweeps': approximately, with n_sweeps backups v = T' r + gamma * T v started from
+      x0 (modified policy iteration)
+    '''
+    b = transition_matrix.T.dot(state_rewards)
+    if evaluation == 'sweeps':
+        value = np.zeros_like(b) if x0 is None else x0
+        for _ in xrange(n_sweeps):
+            value = b + gamma * transition_matrix.dot(value)
+        return value
+    a = sparse.identity(transition_matrix.shape[0], format='csr') - gamma * transition_matrix
+    if evaluation == 'direct':
+        return spsolve(a.tocsc(), b)
+    value, info = gmres(a, b, x0=x0, tol=1e-10, restart=50, maxiter=1000)
+    if info != 0:
+        sys.exit('Policy evaluation did not converge!')
+    return value
 
-def policy_iteration(nrow=3, ncol=4, gamma=1, n_iter=1000):
+def policy_iteration(env, gamma=1, n_iter=1000, evaluation='direct', n_sweeps=20):
     '''
-    Implements the policy iteration algorithm.
+    Implements the policy iteration algorithm. The policy is evaluated on a sparse
+    transition matrix (see evaluate_policy for the evaluation methods). Returns the
+    policy, the values and the number of state backups of the improvement steps (and
+    of the evaluation sweeps).
     '''
-    ## Initialize a random policy
-    policy = np.chararray(shape=(nrow, ncol))
-    policy[goal_state] = '_'
-    policy[trap_state] = '_'
-    policy[wall_state] = '_'
-    for state in states:
-        if state != goal_state and state != trap_state and state != wall_state:
-            rand_action = random.choice(actions)
-            policy[state] = rand_action
-#     print policy
+    ## Initialize a random policy (action indices; the goal, trap and wall rows ignore it)
+    policy = np.zeros(shape=env.num_states, dtype=np.intp)
+    policy[env.free] = [actions.index(random.choice(actions)) for _ in xrange(np.count_nonzero(env.free))]
     
     ## Define a progress bar
     progress = ProgressBar(maxval=n_iter).start()
     ## Run the policy iteration loop
+    ## The threshold of different (modified policy iteration only)
+    epsilon = 1e-5
+    index = np.arange(env.num_states)
+    value = None
+    backups = 0
     for i in range(n_iter):
         ## Compute the value of the current policy
-        ## Solve the linear equations
-        transition_matrix = get_transition_matrix(policy)
-#         print transition_matrix
-        b = np.zeros(shape=(1, len(states))) # the RHS - rewards
-        for state in states:
-            state_idx = states.index(state)
-            if state != wall_state:
-                b[0, state_idx] = rewards[state]
-        b = np.dot(b, transition_matrix)
-        b = b.transpose()
-        
-        ## The matrix of coefficients
-        a = np.identity(len(states)) - gamma * transition_matrix
-        ## Solve for the values
-        value = np.linalg.solve(a, b)
-        ## Update the global value function
-        for state in states:
-            if state != wall_state:
-                state_idx = states.index(state)
-                values[state] = value[state_idx]
-#         print values
+        prev_value = value
+        transition_matrix = env.transition_matrix(policy)
+        value = evaluate_policy(transition_matrix, env.state_rewards, gamma, evaluation, value, n_sweeps)
+        ## Approximate values must also have stopped moving
+        converged = (evaluation != 'sweeps' or
+                     (prev_value is not None and np.max(np.abs(value - prev_value)) < epsilon))
+        backups += (1 + (n_sweeps if evaluation == 'sweeps' else 0)) * np.count_nonzero(env.free)
         
-        is_changed = False
-        for state in states:
-            if state != goal_state and state != trap_state and state != wall_state:
-                q_best = values[state]
-                for action in actions:
-                    q_sa = bellman_update(state, action, gamma)
-                    if q_sa > q_best and action != policy[state]:
-                        policy[state] = action
-                        q_best = q_sa
-                        is_changed = True
-        if not is_changed:
+        ## Switch to the best other action wherever it beats the current one; the
+        ## tolerance keeps rounding errors from flipping between equally good actions
+        q = env.q_values(value, gamma)
+        q_current = q[index, policy]
+        q[index, policy] = -np.inf
+        best = np.argmax(q, 1)
+        changed = env.free & (q[index, best] > q_current + 1e-9 * np.abs(q_current))
+        policy[changed] = best[changed]
+        if not changed.any() and converged:
             progress.finish()
             break
         else:
-#             print policy
             progress.update(i+1)
-    return policy
+    return env.policy_matrix(policy), env.grid(value), backups
 
 if __name__ == '__main__':
     params = parse()
@@ -270,15 +462,33 @@ if __name__ == '__main__':
     goal_reward = params['goal']
     penalty = params['penalty']
     gamma = params['discount']
+    solver = params['solver']
+    evaluation = params['evaluation']
+    
+    if params['sweep']:
+        start = time.time()
+        rows = sweep(nrow, ncol, params['discounts'] or [gamma], params['goals'] or [goal_reward],
+                     params['penalties'] or [penalty], params['batch_size'], params['processes'])
+        write_table(params['output'], rows)
+        print 'Sweep: %d MDPs solved in %.3fs, results written to %s' % (len(rows), time.time() - start,
+                                                                        params['output'])
+        sys.exit()
     
-    build_environment(nrow=nrow, ncol=ncol, goal_reward=goal_reward, penalty=penalty)
-#     print rewards
-#     print values
+    env = build_environment(nrow=nrow, ncol=ncol, goal_reward=goal_reward, penalty=penalty)
+#     print env.rewards
+#     print env.values
 #     print transition
     
-#     policy = value_iteration(nrow, ncol, goal_reward=goal_reward, penalty=penalty,
-#                              gamma=gamma, n_iter=1000)
-    policy = policy_iteration(nrow, ncol, gamma=gamma, n_iter=1000)
+    start = time.time()
+    if solver == 'policy':
+        policy, values, backups = policy_iteration(env, gamma=gamma, n_iter=1000, evaluation=evaluation)
+    elif solver == 'value':
+        policy, values, backups = value_iteration(env, gamma=gamma, n_iter=1000)
+    elif solver == 'gauss-seidel':
+        policy, values, backups = gauss_seidel(env, gamma=gamma, n_iter=1000)
+    else:
+        policy, values, backups = prioritized_sweeping(env, gamma=gamma, n_iter=1000)
+    elapsed = time.time() - start
     print policy
     print values
-    
\ No newline at end of file
+    print 'Solver: %s, %d backups, %.3fs' % (solver, backups, elapsed)
@@ -0,0 +1,151 @@
+'''
+Created on Oct 18, 2026
+
+Periodic, asynchronous checkpoints and exact resumption of training.
+
+A checkpoint is a tf.train.Saver checkpoint of the model variables (including the
+optimizer slots and any global_step variable) plus a pickled .state file holding the
+next step to run, the global NumPy random state and the state of the data pipeline
+(batch cursors, shuffling and sampling random streams), as returned by the get_state()
+methods of the batch sources.
+
+Random state kept inside TensorFlow ops (tf.nn.dropout, tf.random_uniform, ...) is not
+saved, so a resumed run only reproduces the original one exactly if its per-step
+randomness is drawn with NumPy and fed (regularization.py feeds its dropout masks).
+
+Saving does not stall training: the variables are first copied into shadow variables
+inside the graph (one session.run, no transfer to Python), and a background thread
+then writes the shadow copies to disk while training goes on.
+
+@author: trucvietle
+'''
+
+import cPickle as pickle
+import glob
+import os
+import sys
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+
+class CheckpointManager(object):
+    '''
+    Saves and restores checkpoints named <directory>/<name>-<step>, keeping the last
+    max_to_keep of them. Must be created in the training graph, after the optimizer (so
+    that its slot variables are included) and before initializing the variables.
+
+    Typical use:
+        checkpoints = CheckpointManager(directory)
+        state = checkpoints.load() # None, or the data state passed to save()
+        ... restore the batch sources from state, then start prefetching ...
+        with tf.Session(graph=graph) as session:
+            tf.initialize_all_variables().run()
+            for step in xrange(checkpoints.restore(session), num_steps):
+                ...
+                if step % checkpoint_every == 0:
+                    checkpoints.save(session, step + 1, data_state)
+            checkpoints.close()
+    '''
+    def __init__(self, directory, max_to_keep=5, variables=None, name='model'):
+        if variables is None:
+            variables = tf.all_variables()
+        self._directory = directory
+        self._prefix = os.path.join(directory, name)
+        shadows = [tf.Variable(tf.zeros(v.get_shape(), dtype=v.dtype.base_dtype), trainable=False)
+                   for v in variables]
+        self._snapshot = tf.group(*[s.assign(v) for s, v in zip(shadows, variables)])
+        ## The shadows are saved under the names of the variables they copy, so the
+        ## checkpoints restore straight into the model
+        self._saver = tf.train.Saver(dict((v.op.name, s) for v, s in zip(variables, shadows)),
+                                     max_to_keep=max_to_keep)
+        self._restorer = tf.train.Saver(dict((v.op.name, v) for v in variables))
+        self._path = None
+        self._state = None
+        self._thread = None
+        self._error = None
+        self.saves = 0
+        self.blocking_time = 0.0
+
+    def load(self):
+        '''
+        Reads the state of the latest checkpoint, if any, and returns the data state that
+        was passed to save() (None if there is no checkpoint).
+        '''
+        ckpt = tf.train.get_checkpoint_state(self._directory)
+        if ckpt is None or not ckpt.model_checkpoint_path:
+            return None
+        self._path = ckpt.model_checkpoint_path
+        with open(self._path + '.state', 'rb') as f:
+            self._state = pickle.load(f)
+        ## Keep rotating out the checkpoints of the previous runs
+        self._saver.set_last_checkpoints(list(ckpt.all_model_checkpoint_paths))
+        print 'Resuming from', self._path
+        return self._state['data']
+
+    def restore(self, session):
+        '''
+        Restores the variables and the NumPy random state of the checkpoint read by
+        load(). Returns the step to resume from (0 without a checkpoint).
+        '''
+        if self._state is None:
+            return 0
+        self._restorer.restore(session, self._path)
+        np.random.set_state(self._state['numpy_random'])
+        return self._state['step']
+
+    def _write(self, session, step, state):
+        try:
+            path = '%s-%d' % (self._prefix, step)
+            ## The state goes first: the checkpoint index written by the saver only
+            ## points to checkpoints whose state is complete
+            with open(path + '.state.tmp', 'wb') as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(path + '.state.tmp', path + '.state')
+            self._saver.save(session, self._prefix, global_step=step)
+            kept = set(p + '.state' for p in self._saver.last_checkpoints)
+            for stale in glob.glob(self._prefix + '-*.state'):
+                if stale not in kept:
+                    os.remove(stale)
+        except Exception:
+            self._error = sys.exc_info()
+
+    def wait(self):
+        '''
+        Waits for the pending save, re-raising its exception if it failed.
+        '''
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error[0], error[1], error[2]
+
+    def save(self, session, step, data_state=None):
+        '''
+        Checkpoints the current variables as the state before running step, along with
+        data_state (anything picklable). Returns as soon as the variables are copied;
+        the files are written in the background.
+        '''
+        start = time.time()
+        self.wait()
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        session.run(self._snapshot)
+        self.blocking_time += time.time() - start
+        state = {'step': step, 'numpy_random': np.random.get_state(), 'data': data_state}
+        self._thread = threading.Thread(target=self._write, args=(session, step, state))
+        self._thread.start()
+        self.saves += 1
+
+    def close(self):
+        '''
+        Waits for the last save to be written.
+        '''
+        self.wait()
+
+    def stats(self):
+        '''
+        Human readable summary of the time training was blocked by checkpointing.
+        '''
+        return 'Checkpoints: %d saved, %.2fs blocking the training loop' % (self.saves, self.blocking_time)
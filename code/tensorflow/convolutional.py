@@ -6,46 +6,34 @@ Convolutional neural networks.
 @author: trucvietle
 '''
 
-import cPickle as pickle
-import numpy as np
 import tensorflow as tf
-
-pickle_file = '../../data/notMNIST.pickle'
-with open(pickle_file, 'rb') as f:
-    save = pickle.load(f)
-    train_dataset = save['train_dataset']
-    train_labels = save['train_labels']
-    valid_dataset = save['valid_dataset']
-    valid_labels = save['valid_labels']
-    test_dataset = save['test_dataset']
-    test_labels = save['test_labels']
-    del save # to help gc free up memory
-    print 'Training set', train_dataset.shape, train_labels.shape
-    print 'Validation set', valid_dataset.shape, valid_labels.shape
-    print 'Test set', test_dataset.shape, test_labels.shape
+import notmnist_store
+import minibatch
+import prefetch
+import evaluation
+import metrics
+import checkpoint
 
 ## Reformat into TensorFlow-friendly shape:
 ## - Convolutions need the image data formatted as a cube
-## - Labels as float one-hot encoding
+## - Labels as uint8 label ids (sparse_labels) or as float one-hot encoding
 image_size = 28
 num_labels = 10
+sparse_labels = True
+class_names = 'ABCDEFGHIJ'
 num_channels = 1 # grayscale
 
-def reformat(dataset, labels):
-    dataset = dataset.reshape((-1, image_size, image_size, num_channels)).astype(np.float32)
-    labels = (np.arange(num_labels) == labels[:, None]).astype(np.float32)
-    return dataset, labels
-
-train_dataset, train_labels = reformat(train_dataset, train_labels)
+## Load the notMNIST data generated from Lesson 1, memory-mapped from the store that
+## notmnist_store.py converts the pickle into on the first run
+pickle_file = '../../data/notMNIST.pickle'
+store_dir = '../../data/notMNIST_store'
+(train_dataset, train_labels), (valid_dataset, valid_labels), (test_dataset, test_labels) = \
+    notmnist_store.open_store(pickle_file, store_dir, shape=(-1, image_size, image_size, num_channels),
+                              sparse_labels=sparse_labels)
 print 'Training set', train_dataset.shape, train_labels.shape
-valid_dataset, valid_labels = reformat(valid_dataset, valid_labels)
 print 'Validation set', valid_dataset.shape, valid_labels.shape
-test_dataset, test_labels = reformat(test_dataset, test_labels)
 print 'Test set', test_dataset.shape, test_labels.shape
 
-def accuracy(predictions, labels):
-    return(100.0 * np.sum(np.argmax(predictions, 1) == np.argmax(labels, 1)) / predictions.shape[0])
-
 ## Build a small network with two convolutional layers, followed by one fully connected layer.
 ## Convolutional networks are computationally expensive, so we limit its depths and the number of
 ## fully connected nodes.
@@ -65,10 +53,7 @@ graph = tf.Graph()
 with graph.as_default():
     ## Input data
     tf_train_dataset = tf.placeholder(tf.float32, shape=(batch_size, image_size, image_size, num_channels))
-    tf_train_labels = tf.placeholder(tf.float32, shape=(batch_size, num_labels))
-    
-    tf_valid_dataset = tf.constant(valid_dataset)
-    tf_test_dataset = tf.constant(test_dataset)
+    tf_train_labels = metrics.label_placeholder(batch_size, num_labels, sparse_labels)
     
     ## Variables: the model parameters
     layer1_weights = tf.Variable(tf.truncated_normal([patch_size, patch_size, num_channels, depth], stddev=0.1))
@@ -98,7 +83,8 @@ with graph.as_default():
         
 #         shape = hidden.get_shape().as_list()
         shape = h_pool2.get_shape().as_list()
-        reshape = tf.reshape(hidden, [shape[0], shape[1] * shape[2] * shape[3]])
+        ## -1 rather than shape[0], so the model also takes the variable-size evaluation chunks
+        reshape = tf.reshape(hidden, [-1, shape[1] * shape[2] * shape[3]])
         hidden = tf.nn.relu(tf.matmul(reshape, layer3_weights) + layer3_biases)
         
         ## Add dropout to reduce overfitting: turn dropout on during training and off during testing
@@ -109,30 +95,55 @@ with graph.as_default():
     
     ## Training computation
     logits = model(tf_train_dataset)
-    loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits, tf_train_labels))
+    loss = metrics.cross_entropy(logits, tf_train_labels)
     
     ## Optimizer
     optimizer = tf.train.GradientDescentOptimizer(0.05).minimize(loss)
     
-    ## Predictions for the training, validation and test data
-    train_prediction = tf.nn.softmax(logits)
-    valid_prediction = tf.nn.softmax(model(tf_valid_dataset))
-    test_prediction = tf.nn.softmax(model(tf_test_dataset))
+    ## Correct count on the training data; validation and test data are streamed in chunks
+    train_correct = metrics.num_correct(logits, tf_train_labels)
+    evaluator = evaluation.ChunkedEvaluator(model, [image_size, image_size, num_channels], num_labels,
+                                            sparse_labels=sparse_labels)
+    
+    ## Periodic checkpoints of all variables, written in the background
+    checkpoints = checkpoint.CheckpointManager('../../data/checkpoints/convolutional', max_to_keep=3)
 
 num_steps = 1001
+checkpoint_every = 250
+## Prepare the next mini-batches in the background while the session runs
+prefetch_depth = 4
+batch_iterator = minibatch.MinibatchIterator(train_dataset, train_labels, batch_size,
+                                             num_buffers=prefetch_depth + 2)
+## Resume the batch order from the latest checkpoint, if any
+data_state = checkpoints.load()
+if data_state is not None:
+    batch_iterator.set_state(data_state)
+train_batches = prefetch.Prefetcher(batch_iterator.next, depth=prefetch_depth,
+                                    get_state=batch_iterator.get_state)
+print 'Label bytes fed per step:', train_labels[:batch_size].nbytes
+train_metrics = metrics.StreamingMetrics(num_labels)
 with tf.Session(graph=graph) as session:
     tf.initialize_all_variables().run()
     print 'Initialized'
-    for step in xrange(num_steps):
+    for step in xrange(checkpoints.restore(session), num_steps):
         ## Each training iteration, we load batch_size training examples
+        ## in a fresh random order every epoch
         ## We use the feed_dict to replace the placeholder tensors
-        offset = (step * batch_size) % (train_labels.shape[0] - batch_size)
-        batch_data = train_dataset[offset:(offset + batch_size), :, :, :]
-        batch_labels = train_labels[offset:(offset + batch_size), :]
+        batch_data, batch_labels = train_batches.next()
         feed_dict = {tf_train_dataset : batch_data, tf_train_labels : batch_labels}
-        _, l, predictions = session.run([optimizer, loss, train_prediction], feed_dict=feed_dict)
+        _, l, correct = session.run([optimizer, loss, train_correct], feed_dict=feed_dict)
+        train_metrics.update(batch_size, correct, l)
         if (step % 50 == 0):
             print 'Minibatch loss at step', step, ':', l
-            print 'Minibatch accuracy: %.1f%%' % accuracy(predictions, batch_labels)
-            print 'Validation accuracy: %.1f%%' % accuracy(valid_prediction.eval(), valid_labels)
-    print 'Test accuracy: %.1f%%' % accuracy(test_prediction.eval(), test_labels)
+            print 'Minibatch accuracy since last report: %.1f%%' % train_metrics.accuracy()
+            train_metrics.reset()
+            print 'Validation accuracy: %.1f%%' % evaluator.accuracy(valid_dataset, valid_labels)
+        if (step + 1) % checkpoint_every == 0 or step == num_steps - 1:
+            checkpoints.save(session, step + 1, train_batches.get_state())
+    train_batches.close()
+    checkpoints.close()
+    print train_batches.stats()
+    print checkpoints.stats()
+    test_metrics = evaluator.evaluate(test_dataset, test_labels)
+    print 'Test accuracy: %.1f%%' % test_metrics.accuracy()
+    print test_metrics.report(class_names)
@@ -0,0 +1,105 @@
+'''
+Created on Oct 18, 2026
+
+Content-hashed cache of the encoded Text8 corpora.
+
+Encoding text8 (word ids for word2vec, character ids for the LSTM) is done once and
+stored as memory-mappable .npy files under a directory named after a hash of the
+source zip and the encoding parameters. Changing the zip or e.g. vocabulary_size
+gives a new key, so stale entries are never used.
+
+@author: trucvietle
+'''
+
+import hashlib
+import os
+import shutil
+import numpy as np
+import text8
+
+cache_dir = '../../data/cache'
+format_version = 1 # bump when the layout of the cached files changes
+
+def file_digest(filename, block_size=1 << 20):
+    '''
+    SHA-1 of the content of a file.
+    '''
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def entry_dir(filename, kind, cache_dir=cache_dir, **params):
+    '''
+    Directory of the cache entry for the given source file, kind of encoding and
+    encoding parameters.
+    '''
+    key = hashlib.sha1()
+    key.update('%s:%d:%s' % (kind, format_version, file_digest(filename)))
+    for name in sorted(params):
+        key.update(':%s=%r' % (name, params[name]))
+    return os.path.join(cache_dir, '%s-%s' % (kind, key.hexdigest()[:16]))
+
+def _commit(tmp_dir, path):
+    '''
+    Moves a fully written entry into place. If another process won the race, its
+    entry is kept.
+    '''
+    try:
+        os.rename(tmp_dir, path)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _new_tmp_dir(path):
+    tmp_dir = '%s.tmp%d' % (path, os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+def load_word_corpus(filename, vocabulary_size, cache_dir=cache_dir):
+    '''
+    Returns data, count, dictionary, reverse_dictionary as text8.build_dataset does,
+    with data an int32 array memory-mapped from the cache.
+    '''
+    path = entry_dir(filename, 'words', cache_dir, vocabulary_size=vocabulary_size)
+    if not os.path.exists(path):
+        data, count, _, _ = text8.build_dataset(filename, vocabulary_size)
+        tmp_dir = _new_tmp_dir(path)
+        np.save(os.path.join(tmp_dir, 'data.npy'), data)
+        ## One 'word count' line per word, in id order
+        with open(os.path.join(tmp_dir, 'vocab.txt'), 'w') as f:
+            for word, c in count:
+                f.write('%s %d\n' % (word, c))
+        del data
+        _commit(tmp_dir, path)
+    data = np.load(os.path.join(path, 'data.npy'), mmap_mode='r')
+    count = list()
+    with open(os.path.join(path, 'vocab.txt')) as f:
+        for line in f:
+            word, c = line.split()
+            count.append((word, int(c)))
+    count[0] = list(count[0]) # ['UNK', unk_count]
+    dictionary = dict()
+    for word, _ in count:
+        dictionary[word] = len(dictionary)
+    reverse_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
+    return data, count, dictionary, reverse_dictionary
+
+def load_char_corpus(filename, cache_dir=cache_dir):
+    '''
+    Returns the text as a uint8 array of character ids (see text8.encode_chars),
+    memory-mapped from the cache.
+    '''
+    path = entry_dir(filename, 'chars', cache_dir)
+    if not os.path.exists(path):
+        data = text8.build_char_dataset(filename)
+        tmp_dir = _new_tmp_dir(path)
+        np.save(os.path.join(tmp_dir, 'data.npy'), data)
+        del data
+        _commit(tmp_dir, path)
+    return np.load(os.path.join(path, 'data.npy'), mmap_mode='r')
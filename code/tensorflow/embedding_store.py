@@ -0,0 +1,143 @@
+'''
+Created on Oct 18, 2026
+
+Compact, memory-mappable storage of word embeddings and their vocabulary.
+
+A store is a directory with:
+- header.json: format version, number of words, dimension and storage dtype
+- vectors.npy: the [num_words, dim] matrix as float32, float16 or int8
+- scales.npy: per-row float32 scales (int8 only; vector = int8 row * scale)
+- vocab.txt: one word per line, in id order
+- offsets.npy: byte offset of every line of vocab.txt (plus the end of the file)
+- index.npy: open-addressing hash table mapping FNV-1a hashes of the words to ids
+
+Everything is opened with memory mapping, so loading takes milliseconds, pages are
+only read when touched, and several processes serving the same store share them.
+
+@author: trucvietle
+'''
+
+import json
+import os
+import numpy as np
+
+format_version = 1
+dtypes = ['float32', 'float16', 'int8']
+
+def fnv1a(word):
+    '''
+    32-bit FNV-1a hash of a byte string, stable across processes.
+    '''
+    h = 2166136261
+    for c in bytearray(word):
+        h = ((h ^ c) * 16777619) & 0xffffffff
+    return h
+
+def save(path, embeddings, words, dtype='float32'):
+    '''
+    Writes the embeddings (one row per word, words[i] for row i) to the store at path.
+    '''
+    assert dtype in dtypes
+    assert embeddings.shape[0] == len(words)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == 'int8':
+        ## Symmetric per-row quantization
+        scales = np.abs(embeddings).max(1) / 127.0
+        scales[scales == 0] = 1.0
+        vectors = np.round(embeddings / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(path, 'scales.npy'), scales.astype(np.float32))
+    else:
+        vectors = embeddings.astype(dtype)
+    np.save(os.path.join(path, 'vectors.npy'), vectors)
+
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    with open(os.path.join(path, 'vocab.txt'), 'wb') as f:
+        for i, word in enumerate(words):
+            assert '\n' not in word
+            f.write(word + '\n')
+            offsets[i + 1] = offsets[i] + len(word) + 1
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+    ## Linear probing table at most half full
+    size = 1
+    while size < 2 * len(words):
+        size <<= 1
+    index = np.full(size, -1, dtype=np.int32)
+    for i, word in enumerate(words):
+        slot = fnv1a(word) & (size - 1)
+        while index[slot] >= 0:
+            slot = (slot + 1) & (size - 1)
+        index[slot] = i
+    np.save(os.path.join(path, 'index.npy'), index)
+
+    header = {'version': format_version, 'num_words': len(words),
+              'dim': embeddings.shape[1], 'dtype': dtype}
+    with open(os.path.join(path, 'header.json'), 'w') as f:
+        json.dump(header, f)
+
+class EmbeddingStore(object):
+    '''
+    Read-only, memory-mapped view of a store written by save().
+    '''
+    def __init__(self, path):
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        if self.header['version'] != format_version:
+            raise ValueError('Unsupported embedding store version: %r' % self.header['version'])
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        if self.header['dtype'] == 'int8':
+            self._scales = np.load(os.path.join(path, 'scales.npy'), mmap_mode='r')
+        else:
+            self._scales = None
+        self._vocab = np.memmap(os.path.join(path, 'vocab.txt'), dtype=np.uint8, mode='r')
+        self._offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self._index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.header['num_words']
+
+    def word(self, i):
+        '''
+        The word with id i.
+        '''
+        return self._vocab[self._offsets[i]:self._offsets[i + 1] - 1].tostring()
+
+    def id(self, word):
+        '''
+        Id of the word, or -1 if it is not in the vocabulary.
+        '''
+        mask = len(self._index) - 1
+        slot = fnv1a(word) & mask
+        while True:
+            i = self._index[slot]
+            if i < 0:
+                return -1
+            if self.word(i) == word:
+                return int(i)
+            slot = (slot + 1) & mask
+
+    def vector(self, i):
+        '''
+        Float32 embedding of the word with id i (or ids, for an array of ids).
+        '''
+        vector = np.asarray(self.vectors[i], dtype=np.float32)
+        if self._scales is not None:
+            vector = vector * np.asarray(self._scales[i], dtype=np.float32)[..., None]
+        return vector
+
+    def __getitem__(self, word):
+        i = self.id(word)
+        if i < 0:
+            raise KeyError(word)
+        return self.vector(i)
+
+    def __contains__(self, word):
+        return self.id(word) >= 0
+
+def load(path):
+    '''
+    Opens the store at path.
+    '''
+    return EmbeddingStore(path)
@@ -0,0 +1,50 @@
+'''
+Created on Oct 18, 2026
+
+Chunked, constant-memory evaluation of the notMNIST models.
+
+Instead of baking the validation and test sets into the graph with tf.constant (which
+copies them into graph memory and the GraphDef) and running them as one giant batch,
+the sets are streamed through a placeholder in fixed-size chunks. Only the loss and
+the confusion counts of each chunk are fetched, and accumulated in a StreamingMetrics.
+
+@author: trucvietle
+'''
+
+import tensorflow as tf
+import metrics
+
+class ChunkedEvaluator(object):
+    '''
+    Builds, in the current default graph, an evaluation path for model: a function
+    mapping a batch of inputs to logits. Inputs have shape (chunk,) + input_shape and
+    labels are one-hot (chunk, num_labels), or label ids (chunk,) if sparse_labels.
+    '''
+    def __init__(self, model, input_shape, num_labels, chunk_size=1000, sparse_labels=False):
+        self._chunk_size = chunk_size
+        self._num_labels = num_labels
+        self.inputs = tf.placeholder(tf.float32, shape=[None] + list(input_shape))
+        self.labels = metrics.label_placeholder(None, num_labels, sparse_labels)
+        logits = model(self.inputs)
+        self.loss = metrics.cross_entropy(logits, self.labels)
+        self.confusion = metrics.confusion_matrix(logits, self.labels, num_labels)
+
+    def evaluate(self, dataset, labels, session=None):
+        '''
+        StreamingMetrics of the model over the whole dataset, fed chunk by chunk.
+        '''
+        if session is None:
+            session = tf.get_default_session()
+        result = metrics.StreamingMetrics(self._num_labels)
+        for start in xrange(0, dataset.shape[0], self._chunk_size):
+            stop = start + self._chunk_size
+            feed_dict = {self.inputs : dataset[start:stop], self.labels : labels[start:stop]}
+            loss, confusion = session.run([self.loss, self.confusion], feed_dict=feed_dict)
+            result.update(len(dataset[start:stop]), loss=loss, confusion=confusion)
+        return result
+
+    def accuracy(self, dataset, labels, session=None):
+        '''
+        Accuracy (in %) of the model over the whole dataset.
+        '''
+        return self.evaluate(dataset, labels, session).accuracy()
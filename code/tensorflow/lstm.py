@@ -7,20 +7,19 @@ To train a LSTM character model over [Text8](http://mattmahoney.net/dc/textdata)
 '''
 
 import os
-import random
 import string
-import zipfile
+import time
 import numpy as np
 import tensorflow as tf
+import prefetch
+import corpus_cache
+import text8
+import sampling
+import checkpoint
 
-def read_data(filename):
-    f = zipfile.ZipFile(filename)
-    for name in f.namelist():
-        return f.read(name)
-    f.close()
-
+## The text as a uint8 array of character ids (see char2id), cached after the first run
 filename = '../../data/text8.zip'
-text = read_data(filename)
+text = corpus_cache.load_char_corpus(filename)
 print 'Data size', len(text)
 
 ## Create a small validation set
@@ -28,8 +27,8 @@ valid_size = 1000
 valid_text = text[:valid_size]
 train_text = text[valid_size:]
 train_size = len(train_text)
-print train_size, train_text[:64]
-print valid_size, valid_text[:64]
+print train_size, text8.decode_chars(train_text[:64])
+print valid_size, text8.decode_chars(valid_text[:64])
 
 ## Utility functions to map characters to vocabulary IDs and back
 vocabulary_size = len(string.ascii_lowercase) + 1 # [a-z] + ' '
@@ -56,42 +55,83 @@ print id2char(1), id2char(26), id2char(0)
 ## Function to generate training batch for the LSTM model
 batch_size = 64
 num_unrollings = 10
+prefetch_depth = 4 # batches prepared ahead of the training loop
+## Cell variant: the fused cell keeps all gate weights in one [vocabulary_size + num_nodes,
+## 4 * num_nodes] matrix and computes the gates with a single matmul per step. With
+## id_inputs (fused cell only) characters are fed as integer ids and looked up in the
+## input rows of that matrix instead of being multiplied as dense one-hot floats.
+fused_cell = True
+id_inputs = True
+assert fused_cell or not id_inputs
 class BatchGenerator (object):
-    def __init__(self, text, batch_size, num_unrollings):
+    '''
+    Generates unrolled batches from text given as a string or as an array of character
+    ids. The text is encoded once to uint8 ids; each call to next() then gathers the whole
+    (num_unrollings + 1, batch_size) block of ids with one fancy-index over the cursors.
+
+    With one_hot=True, batches are float32 one-hot matrices written into preallocated
+    buffers, which stay valid until num_buffers more calls to next() (use num_buffers > 1
+    when batches are prefetched). With one_hot=False, batches are the id vectors themselves.
+    '''
+    def __init__(self, text, batch_size, num_unrollings, one_hot=True, num_buffers=1):
+        if isinstance(text, str):
+            text = text8.encode_chars(text)
         self._text = text
         self._text_size = len(text)
         self._batch_size = batch_size
         self._num_unrollings = num_unrollings
+        self._one_hot = one_hot
         segment = self._text_size / batch_size
-        self._cursor = [offset * segment for offset in xrange(batch_size)]
-        self._last_batch = self._next_batch()
-
-    def _next_batch(self):
-        '''
-        Generates a single batch from the current cursor position in the data.
-        '''
-        batch = np.zeros(shape=(self._batch_size, vocabulary_size), dtype=np.float)
-        for b in xrange(self._batch_size):
-            batch[b, char2id(self._text[self._cursor[b]])] = 1.0
-            self._cursor[b] = (self._cursor[b] + 1) % self._text_size
-        return batch
+        self._cursor = np.arange(batch_size) * segment
+        self._steps = np.arange(1, num_unrollings + 1)[:, None]
+        if one_hot:
+            self._buffers = [np.zeros(shape=(num_unrollings + 1, batch_size, vocabulary_size), dtype=np.float32)
+                             for _ in xrange(num_buffers)]
+            self._last_ids = [np.zeros(shape=(num_unrollings + 1, batch_size), dtype=np.intp)
+                              for _ in xrange(num_buffers)]
+            self._next_buffer = 0
+        self._last_batch = self._text[self._cursor]
+        self._cursor = (self._cursor + 1) % self._text_size
 
     def next(self):
         '''
         Generates the next array of batches from the data. The array consists of
         the last batch of the previous array, followed by num_unrollings new ones.
         '''
-        batches = [self._last_batch]
-        for step in xrange(self._num_unrollings):
-            batches.append(self._next_batch())
-        self._last_batch = batches[-1]
-        return batches
+        ids = np.empty(shape=(self._num_unrollings + 1, self._batch_size), dtype=np.uint8)
+        ids[0] = self._last_batch
+        ids[1:] = self._text[(self._cursor + self._steps - 1) % self._text_size]
+        self._cursor = (self._cursor + self._num_unrollings) % self._text_size
+        self._last_batch = ids[-1]
+        if not self._one_hot:
+            return list(ids)
+        buf = self._buffers[self._next_buffer]
+        last_ids = self._last_ids[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        ## Only clear the entries set last time this buffer was used
+        rows, cols = np.ogrid[:self._num_unrollings + 1, :self._batch_size]
+        buf[rows, cols, last_ids] = 0.0
+        last_ids[:] = ids
+        buf[rows, cols, last_ids] = 1.0
+        return list(buf)
+
+    def get_state(self):
+        '''
+        Cursors and last batch, to resume from with set_state().
+        '''
+        return {'cursor': self._cursor.copy(), 'last_batch': self._last_batch.copy()}
+
+    def set_state(self, state):
+        self._cursor = state['cursor'].copy()
+        self._last_batch = state['last_batch'].copy()
 
     def characters(self, probabilities):
         '''
-        Turns a one-hot encoding or a probability distribution over the possible
-        characters back into its (most likely) character representation.
+        Turns a one-hot encoding, a probability distribution over the possible
+        characters or a vector of ids back into its (most likely) character representation.
         '''
+        if probabilities.ndim == 1:
+            return [id2char(c) for c in probabilities]
         return [id2char(c) for c in np.argmax(probabilities, 1)]
 
     def batches2string(self, batches):
@@ -103,46 +143,42 @@ class BatchGenerator (object):
             s = [''.join(x) for x in zip(s, self.characters(b))]
         return s
 
-train_batches = BatchGenerator(train_text, batch_size, num_unrollings)
-valid_batches = BatchGenerator(valid_text, 1, 1)
+train_batches = BatchGenerator(train_text, batch_size, num_unrollings, one_hot=not id_inputs,
+                               num_buffers=prefetch_depth + 2)
+## Validation runs valid_streams parallel streams, each over its own valid_size /
+## valid_streams characters, through chunks of valid_unrollings steps. The scan starts at
+## character valid_offset (where the former one-character loop started, after the two
+## preview batches below); with a single stream the perplexity is then exactly the one
+## of feeding one character at a time. Each further stream starts from a reset state,
+## which raises the perplexity slightly.
+valid_streams = 5
+valid_unrollings = 100
+valid_offset = 2
+assert valid_size % (valid_streams * valid_unrollings) == 0
+valid_batches = BatchGenerator(np.roll(valid_text, -valid_offset), valid_streams, valid_unrollings,
+                               one_hot=not id_inputs)
 
 print train_batches.batches2string(train_batches.next())
 print train_batches.batches2string(train_batches.next())
-print valid_batches.batches2string(valid_batches.next())
-print valid_batches.batches2string(valid_batches.next())
+## The validation preview has its own generator, so it does not move the evaluation scan
+valid_preview = BatchGenerator(valid_text, 1, 1, one_hot=not id_inputs)
+print valid_preview.batches2string(valid_preview.next())
+print valid_preview.batches2string(valid_preview.next())
 
 def logprob(predictions, labels):
     '''
-    Log probability of the true labels in a predicted batch.
+    Log probability of the true labels (one-hot or ids) in a predicted batch.
     '''
     predictions[predictions < 1e-10] = 1e-10
+    if labels.ndim == 1:
+        return np.sum(-np.log(predictions[np.arange(labels.shape[0]), labels])) / labels.shape[0]
     return np.sum(np.multiply(labels, -np.log(predictions))) / labels.shape[0]
 
-def sample_distribution(distribution):
-    '''
-    Sample one element from the distribution assumed to be an array of normalized probabilities.
-    '''
-    r = random.uniform(0, 1)
-    s = 0
-    for i in xrange(len(distribution)):
-        s += distribution[i]
-        if s >= r:
-            return i
-    return len(distribution) - 1
-
-def sample(prediction):
+def random_distribution(num_rows=1):
     '''
-    Turns a (column) prediction into one-hot encoded samples.
+    Generates random columns of probabilities.
     '''
-    p = np.zeros(shape=[1, vocabulary_size], dtype=np.float)
-    p[0, sample_distribution(prediction[0])] = 1.0
-    return p
-
-def random_distribution():
-    '''
-    Generates a random column of probabilities.
-    '''
-    b = np.random.uniform(0.0, 1.0, size=[1, vocabulary_size])
+    b = np.random.uniform(0.0, 1.0, size=[num_rows, vocabulary_size])
     return b / np.sum(b, 1)[:, None]
 
 ## Simple LSTM model
@@ -151,22 +187,28 @@ num_nodes = 64
 graph = tf.Graph()
 with graph.as_default():
     ## Parameters
-    ## Input gate: input, previous output, and bias
-    ix = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
-    im = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
-    ib = tf.Variable(tf.zeros([1, num_nodes]))
-    ## Forget gate: input, previous output, and bias
-    fx = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
-    fm = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
-    fb = tf.Variable(tf.zeros([1, num_nodes]))
-    ## Memory cell: input, state and bias
-    cx = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
-    cm = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
-    cb = tf.Variable(tf.zeros([1, num_nodes]))
-    ## Output gate: input, previous output, and bias
-    ox = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
-    om = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
-    ob = tf.Variable(tf.zeros([1, num_nodes]))
+    if fused_cell:
+        ## Input, forget, update and output gates side by side: rows for the input, then
+        ## rows for the previous output
+        gate_weights = tf.Variable(tf.truncated_normal([vocabulary_size + num_nodes, 4 * num_nodes], -0.1, 0.1))
+        gate_biases = tf.Variable(tf.zeros([1, 4 * num_nodes]))
+    else:
+        ## Input gate: input, previous output, and bias
+        ix = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
+        im = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
+        ib = tf.Variable(tf.zeros([1, num_nodes]))
+        ## Forget gate: input, previous output, and bias
+        fx = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
+        fm = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
+        fb = tf.Variable(tf.zeros([1, num_nodes]))
+        ## Memory cell: input, state and bias
+        cx = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
+        cm = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
+        cb = tf.Variable(tf.zeros([1, num_nodes]))
+        ## Output gate: input, previous output, and bias
+        ox = tf.Variable(tf.truncated_normal([vocabulary_size, num_nodes], -0.1, 0.1))
+        om = tf.Variable(tf.truncated_normal([num_nodes, num_nodes], -0.1, 0.1))
+        ob = tf.Variable(tf.zeros([1, num_nodes]))
     ## Variables saving state across unrollings
     saved_output = tf.Variable(tf.zeros([batch_size, num_nodes]), trainable=False)
     saved_state = tf.Variable(tf.zeros([batch_size, num_nodes]), trainable=False)
@@ -187,10 +229,42 @@ with graph.as_default():
         output_gate = tf.sigmoid(tf.matmul(i, ox) + tf.matmul(o, om) + ob)
         return output_gate * tf.tanh(state), state
     
+    def fused_lstm_cell(i, o, state):
+        '''
+        Same cell as lstm_cell, with all four gates computed by one matmul and a split.
+        i is either a one-hot batch or, with id_inputs, a vector of character ids.
+        '''
+        if id_inputs:
+            ## Selecting the input rows of the gate weights is the product with the one-hot input
+            input_rows = tf.nn.embedding_lookup(gate_weights, i)
+            output_rows = tf.slice(gate_weights, [vocabulary_size, 0], [num_nodes, 4 * num_nodes])
+            gates = input_rows + tf.matmul(o, output_rows) + gate_biases
+        else:
+            gates = tf.matmul(tf.concat(1, [i, o]), gate_weights) + gate_biases
+        input_gate, forget_gate, update, output_gate = tf.split(1, 4, gates)
+        state = tf.sigmoid(forget_gate) * state + tf.sigmoid(input_gate) * tf.tanh(update)
+        return tf.sigmoid(output_gate) * tf.tanh(state), state
+    
+    if fused_cell:
+        lstm_cell = fused_lstm_cell
+    
+    def input_placeholder(size):
+        '''
+        Placeholder for a batch of size characters, as ids or one-hot encoded.
+        '''
+        if id_inputs:
+            return tf.placeholder(tf.int32, shape=[size])
+        return tf.placeholder(tf.float32, shape=[size, vocabulary_size])
+    
+    def cross_entropy(logits, labels):
+        if id_inputs:
+            return tf.nn.sparse_softmax_cross_entropy_with_logits(logits, labels)
+        return tf.nn.softmax_cross_entropy_with_logits(logits, labels)
+    
     ## Input data
     train_data = list()
     for _ in xrange(num_unrollings + 1):
-        train_data.append(tf.placeholder(tf.float32, shape=[batch_size, vocabulary_size]))
+        train_data.append(input_placeholder(batch_size))
     train_inputs = train_data[:num_unrollings]
     train_labels = train_data[1:] # labels are inputs shifted by one time step
         
@@ -206,7 +280,7 @@ with graph.as_default():
     with tf.control_dependencies([saved_output.assign(output), saved_state.assign(state)]):
         ## Classifier
         logits = tf.nn.xw_plus_b(tf.concat(0, outputs), w, b)
-        loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits, tf.concat(0, train_labels)))
+        loss = tf.reduce_mean(cross_entropy(logits, tf.concat(0, train_labels)))
         
     ## Optimizer
     global_step = tf.Variable(0)
@@ -219,57 +293,143 @@ with graph.as_default():
     ## Predictions
     train_prediction = tf.nn.softmax(logits)
     
-    ## Sampling and validation eval: batch 1, no unrolling
-    sample_input = tf.placeholder(tf.float32, shape=[1, vocabulary_size])
-    saved_sample_output = tf.Variable(tf.zeros([1, num_nodes]))
-    saved_sample_state = tf.Variable(tf.zeros([1, num_nodes]))
-    reset_sample_state = tf.group(saved_sample_output.assign(tf.zeros([1, num_nodes])),
-                                  saved_sample_state.assign(tf.zeros([1, num_nodes])))
-    sample_output, sample_state = lstm_cell(sample_input, saved_sample_output, saved_sample_state)
-    with tf.control_dependencies([saved_sample_output.assign(sample_output),
-                                  saved_sample_state.assign(sample_state)]):
-        sample_prediction = tf.nn.softmax(tf.nn.xw_plus_b(sample_output, w, b))
+    ## Validation eval: valid_streams parallel streams, unrolled over valid_unrollings steps
+    valid_data = list()
+    for _ in xrange(valid_unrollings + 1):
+        valid_data.append(input_placeholder(valid_streams))
+    saved_valid_output = tf.Variable(tf.zeros([valid_streams, num_nodes]), trainable=False)
+    saved_valid_state = tf.Variable(tf.zeros([valid_streams, num_nodes]), trainable=False)
+    reset_valid_state = tf.group(saved_valid_output.assign(tf.zeros([valid_streams, num_nodes])),
+                                 saved_valid_state.assign(tf.zeros([valid_streams, num_nodes])))
+    valid_outputs = list()
+    valid_output = saved_valid_output
+    valid_state = saved_valid_state
+    for i in valid_data[:valid_unrollings]:
+        valid_output, valid_state = lstm_cell(i, valid_output, valid_state)
+        valid_outputs.append(valid_output)
+    with tf.control_dependencies([saved_valid_output.assign(valid_output),
+                                  saved_valid_state.assign(valid_state)]):
+        ## Summed negative log probability of the whole chunk in one reduction
+        valid_logits = tf.nn.xw_plus_b(tf.concat(0, valid_outputs), w, b)
+        valid_logprob = tf.reduce_sum(cross_entropy(valid_logits, tf.concat(0, valid_data[1:])))
+    
+    ## Text generation: num_samples sequences sampled in parallel, no unrolling
+    num_samples = 5
+    samples_input = input_placeholder(num_samples)
+    samples_temperature = tf.placeholder(tf.float32, shape=[])
+    saved_samples_output = tf.Variable(tf.zeros([num_samples, num_nodes]))
+    saved_samples_state = tf.Variable(tf.zeros([num_samples, num_nodes]))
+    reset_samples_state = tf.group(saved_samples_output.assign(tf.zeros([num_samples, num_nodes])),
+                                   saved_samples_state.assign(tf.zeros([num_samples, num_nodes])))
+    samples_output, samples_state = lstm_cell(samples_input, saved_samples_output, saved_samples_state)
+    with tf.control_dependencies([saved_samples_output.assign(samples_output),
+                                  saved_samples_state.assign(samples_state)]):
+        samples_prediction = tf.nn.softmax(tf.nn.xw_plus_b(samples_output, w, b) / samples_temperature)
+    
+    ## Periodic checkpoints of all variables (including global_step and the saved LSTM
+    ## state), written in the background
+    checkpoints = checkpoint.CheckpointManager('../../data/checkpoints/lstm', max_to_keep=3)
+
+def generate_text(sample_length=80, temperature=1.0, top_k=None, top_p=None, random=None):
+    '''
+    Generates num_samples sentences of sample_length characters in parallel, starting
+    each from a random character. Lower temperatures give more conservative samples;
+    top_k and top_p optionally restrict each draw to the most likely characters.
+    Returns the sentences and the number of characters generated per second.
+    '''
+    start = time.time()
+    random = sampling.get_random(random)
+    reset_samples_state.run()
+    ids = np.empty(shape=[sample_length, num_samples], dtype=np.intp)
+    ids[0] = sampling.categorical(random_distribution(num_samples), random)
+    feed = np.zeros(shape=[num_samples, vocabulary_size], dtype=np.float32)
+    for t in xrange(1, sample_length):
+        if id_inputs:
+            feed = ids[t - 1]
+        else:
+            sampling.one_hot(ids[t - 1], vocabulary_size, out=feed)
+        prediction = samples_prediction.eval({samples_input: feed, samples_temperature: temperature})
+        if top_k is not None:
+            prediction = sampling.top_k_filter(prediction, top_k)
+        if top_p is not None:
+            prediction = sampling.nucleus_filter(prediction, top_p)
+        ids[t] = sampling.categorical(prediction, random)
+    sentences = [text8.decode_chars(ids[:, k]) for k in xrange(num_samples)]
+    return sentences, num_samples * sample_length / (time.time() - start)
+
+def validation_perplexity():
+    '''
+    Perplexity of the model over the validation text, evaluated in chunks.
+    '''
+    reset_valid_state.run()
+    total_logprob = 0.0
+    for _ in xrange(valid_size / (valid_streams * valid_unrollings)):
+        feed_dict = dict(zip(valid_data, valid_batches.next()))
+        total_logprob += valid_logprob.eval(feed_dict)
+    return float(np.exp(total_logprob / valid_size))
 
 num_steps = 7001
+checkpoint_every = 1000
 summary_freq = 100
+sample_length = 80 # characters per generated sentence
+sample_temperature = 1.0
+## Resume the text cursors from the latest checkpoint, if any
+resume_state = checkpoints.load()
+if resume_state is not None:
+    train_batches.set_state(resume_state['train'])
+    valid_batches.set_state(resume_state['valid'])
+## Build the next unrolled batches in the background while the session runs
+train_feed = prefetch.Prefetcher(train_batches.next, depth=prefetch_depth,
+                                 get_state=train_batches.get_state)
+
+## Compare the cell variants: parameters and bytes fed per training step
+if fused_cell:
+    num_cell_params = (vocabulary_size + num_nodes) * 4 * num_nodes + 4 * num_nodes
+else:
+    num_cell_params = 4 * (vocabulary_size * num_nodes + num_nodes * num_nodes + num_nodes)
+feed_bytes = (num_unrollings + 1) * batch_size * (4 if id_inputs else 4 * vocabulary_size)
+print 'Cell: %s, inputs: %s' % ('fused' if fused_cell else 'separate', 'ids' if id_inputs else 'one-hot')
+print 'Cell parameters: %d (%.1f KB), fed per step: %.1f KB' % (num_cell_params, num_cell_params * 4 / 1024.0,
+                                                               feed_bytes / 1024.0)
 
 with tf.Session(graph=graph) as session:
     tf.initialize_all_variables().run()
     print 'Initialized'
     mean_loss = 0
-    for step in xrange(num_steps):
-        batches = train_batches.next()
+    step_time = 0.0
+    for step in xrange(checkpoints.restore(session), num_steps):
+        batches = train_feed.next()
         feed_dict = dict()
         for i in xrange(num_unrollings + 1):
             feed_dict[train_data[i]] = batches[i]
+        start = time.time()
         _, l, predictions, lr = session.run([optimizer, loss, train_prediction, learning_rate], feed_dict=feed_dict)
+        step_time += time.time() - start
         mean_loss += l
         if step % summary_freq == 0:
             if step > 0:
                 mean_loss = mean_loss / summary_freq
             ## The mean loss is an estimate of the loss over the last few batches
             print 'Average loss at step', step, ':', mean_loss, 'learning rate:', lr
+            print 'Mean step time: %.2f ms' % (1000.0 * step_time / (summary_freq if step > 0 else 1))
             mean_loss = 0
+            step_time = 0.0
             labels = np.concatenate(list(batches)[1:])
             print 'Minibatch perplexity: %.2f' % float(np.exp(logprob(predictions, labels)))
             if step % (summary_freq * 10) == 0:
                 ## Generate some samples
                 print '=' * 80
-                for _ in xrange(5):
-                    feed = sample(random_distribution())
-                    sentence = train_batches.characters(feed)[0]
-                    reset_sample_state.run()
-                    for _ in xrange(79):
-                        prediction = sample_prediction.eval({sample_input: feed})
-                        feed = sample(prediction)
-                        sentence += train_batches.characters(feed)[0]
+                sentences, chars_per_sec = generate_text(sample_length, sample_temperature)
+                for sentence in sentences:
                     print sentence
+                print 'Sampling speed: %.0f characters/second' % chars_per_sec
                 print '=' * 80
             ## Measure validation set perplexity
-            reset_sample_state.run()
-            valid_logprob = 0
-            for _ in xrange(valid_size):
-                b = valid_batches.next()
-                predictions = sample_prediction.eval({sample_input: b[0]})
-                valid_logprob = valid_logprob + logprob(predictions, b[1])
-            print 'Validation set perplexity: %.2f' % float(np.exp(valid_logprob / valid_size))
+            print 'Validation set perplexity: %.2f' % validation_perplexity()
+        if (step + 1) % checkpoint_every == 0 or step == num_steps - 1:
+            checkpoints.save(session, step + 1, {'train': train_feed.get_state(),
+                                                 'valid': valid_batches.get_state()})
+    train_feed.close()
+    checkpoints.close()
+    print train_feed.stats()
+    print checkpoints.stats()
@@ -0,0 +1,135 @@
+'''
+Created on Oct 18, 2026
+
+Streaming classification metrics.
+
+Correct counts, losses and confusion matrices are computed inside the graph, so a
+training step or an evaluation chunk only fetches a few scalars (or the
+num_labels x num_labels confusion counts) instead of the full softmax output.
+StreamingMetrics accumulates them across batches in O(num_labels^2) memory and
+derives accuracy, mean loss and per-class precision/recall.
+
+Labels are either float one-hot rows ([batch, num_labels]) or integer label ids
+([batch], e.g. uint8 as stored by notmnist_store.py); the graph helpers below accept
+both, telling them apart by rank.
+
+@author: trucvietle
+'''
+
+import numpy as np
+import tensorflow as tf
+
+def _is_sparse(labels):
+    return labels.get_shape().ndims == 1
+
+def label_placeholder(batch_size, num_labels, sparse_labels=False):
+    '''
+    Placeholder for a batch of labels: uint8 label ids if sparse_labels, float32 one-hot
+    rows otherwise. batch_size may be None.
+    '''
+    if sparse_labels:
+        return tf.placeholder(tf.uint8, shape=[batch_size])
+    return tf.placeholder(tf.float32, shape=[batch_size, num_labels])
+
+def cross_entropy(logits, labels):
+    '''
+    Mean softmax cross-entropy; the sparse op is used for integer label ids, so no
+    one-hot targets are ever materialized.
+    '''
+    if _is_sparse(labels):
+        return tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(
+            logits, tf.cast(labels, tf.int32)))
+    return tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits, labels))
+
+def num_correct(logits, labels):
+    '''
+    Number of rows of logits whose argmax matches the labels, as an int32 scalar.
+    '''
+    if _is_sparse(labels):
+        correct = tf.equal(tf.argmax(logits, 1), tf.cast(labels, tf.int64))
+    else:
+        correct = tf.equal(tf.argmax(logits, 1), tf.argmax(labels, 1))
+    return tf.reduce_sum(tf.cast(correct, tf.int32))
+
+def confusion_matrix(logits, labels, num_labels):
+    '''
+    [num_labels, num_labels] int32 counts of (true label, predicted label) pairs: rows
+    are the true labels, columns the predictions.
+    '''
+    if _is_sparse(labels):
+        labels = tf.one_hot(tf.cast(labels, tf.int32), num_labels)
+    predicted = tf.one_hot(tf.argmax(logits, 1), num_labels)
+    return tf.cast(tf.matmul(labels, predicted, transpose_a=True), tf.int32)
+
+class StreamingMetrics(object):
+    '''
+    Accumulates the number of examples, correct predictions, loss and, when given, the
+    confusion matrix over a sequence of batches.
+    '''
+    def __init__(self, num_labels):
+        self.num_labels = num_labels
+        self.reset()
+
+    def reset(self):
+        self.num_examples = 0
+        self.num_correct = 0
+        self.total_loss = 0.0
+        self.confusion = np.zeros((self.num_labels, self.num_labels), dtype=np.int64)
+
+    def update(self, num_examples, num_correct=None, loss=None, confusion=None):
+        '''
+        Adds a batch of num_examples examples. loss is the mean loss of the batch. The
+        number of correct predictions is the trace of confusion when it is not given.
+        '''
+        self.num_examples += num_examples
+        if confusion is not None:
+            self.confusion += confusion
+            if num_correct is None:
+                num_correct = np.trace(confusion)
+        if num_correct is not None:
+            self.num_correct += int(num_correct)
+        if loss is not None:
+            self.total_loss += float(loss) * num_examples
+
+    def update_predictions(self, predicted, labels, loss=None):
+        '''
+        Adds a batch given as integer arrays of predicted and true label ids.
+        '''
+        n = self.num_labels
+        confusion = np.bincount(np.asarray(labels, dtype=np.int64) * n + predicted,
+                                minlength=n * n).reshape(n, n)
+        self.update(len(labels), loss=loss, confusion=confusion)
+
+    def accuracy(self):
+        '''
+        Accuracy (in %) over all the examples seen since the last reset.
+        '''
+        return 100.0 * self.num_correct / max(self.num_examples, 1)
+
+    def mean_loss(self):
+        return self.total_loss / max(self.num_examples, 1)
+
+    def precision(self):
+        '''
+        Per-class precision, from the confusion matrix (0 for classes never predicted).
+        '''
+        predicted = self.confusion.sum(0)
+        return np.diag(self.confusion) / np.maximum(predicted, 1).astype(np.float64)
+
+    def recall(self):
+        '''
+        Per-class recall, from the confusion matrix (0 for classes never seen).
+        '''
+        actual = self.confusion.sum(1)
+        return np.diag(self.confusion) / np.maximum(actual, 1).astype(np.float64)
+
+    def report(self, class_names=None):
+        '''
+        Per-class precision and recall as a printable table.
+        '''
+        if class_names is None:
+            class_names = [str(i) for i in xrange(self.num_labels)]
+        lines = ['class  precision  recall  support']
+        for name, p, r, s in zip(class_names, self.precision(), self.recall(), self.confusion.sum(1)):
+            lines.append('%5s  %8.1f%%  %5.1f%%  %7d' % (name, 100 * p, 100 * r, s))
+        return '\n'.join(lines)
@@ -0,0 +1,91 @@
+'''
+Created on Oct 18, 2026
+
+Shuffled, epoch-aware minibatch iterator shared by the notMNIST trainers.
+
+@author: trucvietle
+'''
+
+import numpy as np
+
+class MinibatchIterator(object):
+    '''
+    Serves minibatches of (dataset, labels) in a fresh random order every epoch.
+
+    The order is kept as a permutation of indices, so the arrays themselves are never
+    shuffled or copied and can be memory-mapped (see notmnist_store.py). Each batch is
+    gathered into preallocated buffers. A batch that runs past the end of an epoch is
+    completed with the start of the next one, so no example is skipped.
+
+    The buffers are reused: a returned batch stays valid until num_buffers more batches
+    have been drawn. Use num_buffers > 1 if batches are held on to (e.g. prefetched).
+    '''
+    def __init__(self, dataset, labels, batch_size, num_buffers=1, seed=None):
+        assert dataset.shape[0] == labels.shape[0]
+        assert batch_size <= dataset.shape[0]
+        self._dataset = dataset
+        self._labels = labels
+        self._size = dataset.shape[0]
+        self._batch_size = batch_size
+        self._random = np.random.RandomState(seed)
+        self._data_buffers = [np.empty((batch_size,) + dataset.shape[1:], dtype=dataset.dtype)
+                              for _ in xrange(num_buffers)]
+        self._label_buffers = [np.empty((batch_size,) + labels.shape[1:], dtype=labels.dtype)
+                               for _ in xrange(num_buffers)]
+        self._index_buffer = np.empty(batch_size, dtype=np.intp)
+        self._next_buffer = 0
+        self.epoch = 0
+        self._new_permutation()
+        self._cursor = 0
+
+    def _new_permutation(self):
+        ## The random state an epoch starts from is enough to redraw its permutation
+        self._epoch_random_state = self._random.get_state()
+        self._permutation = self._random.permutation(self._size)
+
+    def _next_indices(self):
+        '''
+        Takes the next batch_size indices from the permutation, starting a new epoch
+        when it is exhausted.
+        '''
+        indices = self._index_buffer
+        filled = 0
+        while filled < self._batch_size:
+            if self._cursor == self._size:
+                self.epoch += 1
+                self._new_permutation()
+                self._cursor = 0
+            n = min(self._batch_size - filled, self._size - self._cursor)
+            indices[filled:filled + n] = self._permutation[self._cursor:self._cursor + n]
+            self._cursor += n
+            filled += n
+        ## Reading in increasing order is friendlier to memory-mapped sources
+        indices.sort()
+        return indices
+
+    def next(self):
+        '''
+        Returns the next (batch_data, batch_labels) pair.
+        '''
+        indices = self._next_indices()
+        batch_data = self._data_buffers[self._next_buffer]
+        batch_labels = self._label_buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._data_buffers)
+        np.take(self._dataset, indices, axis=0, out=batch_data)
+        np.take(self._labels, indices, axis=0, out=batch_labels)
+        return batch_data, batch_labels
+
+    def get_state(self):
+        '''
+        Position in the stream of batches, to resume from with set_state().
+        '''
+        return {'epoch': self.epoch, 'cursor': self._cursor, 'random': self._epoch_random_state}
+
+    def set_state(self, state):
+        self._random.set_state(state['random'])
+        self._new_permutation()
+        self.epoch = state['epoch']
+        self._cursor = state['cursor']
+
+    def __iter__(self):
+        return self
@@ -0,0 +1,130 @@
+'''
+Created on Oct 18, 2026
+
+Nearest-neighbour queries over (normalized) word embeddings.
+
+@author: trucvietle
+'''
+
+import numpy as np
+
+def top_k(scores, k):
+    '''
+    Indices of the k largest scores of each row, best first. Uses argpartition, so only
+    the k winners get sorted.
+    '''
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    rows = np.arange(scores.shape[0])[:, None]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-scores[rows, best], axis=1)
+    return best[rows, order]
+
+class NearestNeighbours(object):
+    '''
+    Exact cosine nearest neighbours over an [vocabulary_size, embedding_size] matrix of
+    normalized embeddings. Similarities are computed one block of the vocabulary at a
+    time and merged into a running top-k, so memory stays O(queries * block_size).
+    '''
+    def __init__(self, embeddings, block_size=8192):
+        self._embeddings = embeddings
+        self._block_size = block_size
+
+    def query(self, vectors, k=8, exclude=None):
+        '''
+        Returns (ids, similarities) of the k nearest neighbours of each query vector
+        (ids of -1 pad rows with fewer than k candidates). exclude optionally gives, per
+        query, one id to leave out (usually the query word).
+        '''
+        vectors = np.atleast_2d(vectors)
+        num_queries = vectors.shape[0]
+        rows = np.arange(num_queries)[:, None]
+        best_ids = np.full((num_queries, k), -1, dtype=np.intp)
+        best_sims = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        for start in xrange(0, self._embeddings.shape[0], self._block_size):
+            block = self._embeddings[start:start + self._block_size]
+            sims = np.dot(vectors, block.T)
+            if exclude is not None:
+                inside = (exclude >= start) & (exclude < start + block.shape[0])
+                sims[np.nonzero(inside)[0], exclude[inside] - start] = -np.inf
+            ## Merge the block's own top k with the running one
+            block_best = top_k(sims, k)
+            ids = np.concatenate([best_ids, start + block_best], 1)
+            sims = np.concatenate([best_sims, sims[rows, block_best]], 1)
+            keep = top_k(sims, k)
+            best_ids = ids[rows, keep]
+            best_sims = sims[rows, keep]
+        ## Excluded ids can only have been kept as padding
+        best_ids[best_sims == -np.inf] = -1
+        return best_ids, best_sims
+
+    def query_ids(self, ids, k=8):
+        '''
+        Nearest neighbours of the given word ids, excluding the words themselves.
+        '''
+        ids = np.asarray(ids)
+        return self.query(self._embeddings[ids], k, exclude=ids)
+
+    def query_words(self, words, dictionary, reverse_dictionary, k=8):
+        '''
+        Maps each word string to the list of its k nearest words. Raises KeyError for a
+        word not in the vocabulary (out-of-vocabulary words were counted as 'UNK' in
+        training and have no embedding of their own).
+        '''
+        missing = [word for word in words if word not in dictionary]
+        if missing:
+            raise KeyError('Not in the vocabulary: %s' % ', '.join(missing))
+        ids = np.array([dictionary[word] for word in words])
+        nearest, _ = self.query_ids(ids, k)
+        return dict((word, [reverse_dictionary[i] for i in row if i >= 0]) for word, row in zip(words, nearest))
+
+class LSHIndex(NearestNeighbours):
+    '''
+    Approximate cosine nearest neighbours with random-projection locality sensitive
+    hashing. Each of num_tables tables hashes every embedding to the signs of num_bits
+    random projections; a query only scores the words sharing a bucket with it in at
+    least one table, then ranks those candidates exactly.
+    '''
+    def __init__(self, embeddings, num_bits=12, num_tables=8, seed=None, block_size=8192):
+        NearestNeighbours.__init__(self, embeddings, block_size)
+        random = np.random.RandomState(seed)
+        self._planes = random.randn(num_tables, embeddings.shape[1], num_bits).astype(np.float32)
+        self._powers = 1 << np.arange(num_bits)
+        self._tables = list()
+        for t in xrange(num_tables):
+            keys = self._hash(embeddings, t)
+            ## Bucket contents as slices of the ids sorted by key
+            order = np.argsort(keys, kind='mergesort')
+            sorted_keys = keys[order]
+            self._tables.append((order, sorted_keys))
+
+    def _hash(self, vectors, table):
+        bits = np.dot(vectors, self._planes[table]) > 0
+        return np.dot(bits, self._powers)
+
+    def candidates(self, vector):
+        '''
+        Ids of the words sharing a bucket with the vector in any table.
+        '''
+        found = list()
+        for t, (order, sorted_keys) in enumerate(self._tables):
+            key = self._hash(vector[None, :], t)[0]
+            lo, hi = np.searchsorted(sorted_keys, [key, key + 1])
+            found.append(order[lo:hi])
+        return np.unique(np.concatenate(found))
+
+    def query(self, vectors, k=8, exclude=None):
+        vectors = np.atleast_2d(vectors)
+        best_ids = np.full((vectors.shape[0], k), -1, dtype=np.intp)
+        best_sims = np.full((vectors.shape[0], k), -np.inf, dtype=np.float32)
+        for q, vector in enumerate(vectors):
+            candidates = self.candidates(vector)
+            if exclude is not None:
+                candidates = candidates[candidates != exclude[q]]
+            if len(candidates) == 0:
+                continue
+            sims = np.dot(self._embeddings[candidates], vector)
+            keep = top_k(sims, k)[0]
+            best_ids[q, :len(keep)] = candidates[keep]
+            best_sims[q, :len(keep)] = sims[keep]
+        return best_ids, best_sims
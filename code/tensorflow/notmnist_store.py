@@ -0,0 +1,114 @@
+'''
+Created on Oct 18, 2026
+
+On-disk, memory-mapped store for the notMNIST data generated from Lesson 1.
+
+The pickle is converted once into one .npy file per array, already as float32 and
+with labels both as float one-hot encodings and as uint8 label ids. The training
+scripts then open the arrays with memory mapping, so loading is near-instant and only
+the pages actually touched are read into memory.
+
+@author: trucvietle
+'''
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import cPickle as pickle
+import os
+import numpy as np
+
+image_size = 28
+num_labels = 10
+splits = ['train', 'valid', 'test']
+
+def array_path(store_dir, split, kind):
+    '''
+    Path of the .npy file holding the given split ('train', 'valid', 'test') and
+    kind ('dataset', 'labels', 'label_ids').
+    '''
+    return os.path.join(store_dir, '%s_%s.npy' % (split, kind))
+
+def exists(store_dir, kinds=('dataset', 'labels', 'label_ids')):
+    '''
+    Whether all arrays of the given kinds have been written.
+    '''
+    for split in splits:
+        for kind in kinds:
+            if not os.path.exists(array_path(store_dir, split, kind)):
+                return False
+    return True
+
+def _write(path, array):
+    '''
+    Writes the array to a .npy file through a temporary file so that an interrupted
+    conversion never leaves a truncated array behind.
+    '''
+    tmp_path = path + '.tmp'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=array.dtype, shape=array.shape)
+    out[:] = array
+    out.flush()
+    del out
+    os.rename(tmp_path, path)
+
+def convert(pickle_file, store_dir):
+    '''
+    One-time conversion of the notMNIST pickle into the memory-mappable store.
+    '''
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    with open(pickle_file, 'rb') as f:
+        save = pickle.load(f)
+    for split in splits:
+        dataset = save.pop('%s_dataset' % split)
+        labels = save.pop('%s_labels' % split)
+        ## Images as float32 (N, image_size, image_size); each script reshapes as a view
+        dataset = dataset.reshape((-1, image_size, image_size)).astype(np.float32, copy=False)
+        _write(array_path(store_dir, split, 'dataset'), dataset)
+        del dataset
+        _write(array_path(store_dir, split, 'label_ids'), labels.astype(np.uint8))
+        ## Map 0 to [1.0, 0.0, 0.0, ...], 1 to [0.0, 1.0, 0.0, ...]
+        labels = (np.arange(num_labels) == labels[:, None]).astype(np.float32)
+        _write(array_path(store_dir, split, 'labels'), labels)
+        print split, 'set written to', store_dir
+    del save
+
+def add_label_ids(store_dir):
+    '''
+    Writes the uint8 label ids of a store converted before they were stored, from its
+    one-hot labels.
+    '''
+    for split in splits:
+        labels = np.load(array_path(store_dir, split, 'labels'), mmap_mode='r')
+        _write(array_path(store_dir, split, 'label_ids'), np.argmax(labels, 1).astype(np.uint8))
+
+def load(store_dir, split, shape=None, sparse_labels=False, mmap_mode='r'):
+    '''
+    Opens the dataset and labels of a split with memory mapping. The dataset is
+    reshaped (as a view, no copy) to the given shape, e.g. (-1, 784) for the fully
+    connected models or (-1, 28, 28, 1) for the convolutional one. The labels are
+    uint8 label ids if sparse_labels, float32 one-hot rows otherwise.
+    '''
+    dataset = np.load(array_path(store_dir, split, 'dataset'), mmap_mode=mmap_mode)
+    kind = 'label_ids' if sparse_labels else 'labels'
+    labels = np.load(array_path(store_dir, split, kind), mmap_mode=mmap_mode)
+    if shape is not None:
+        dataset = dataset.reshape(shape)
+    return dataset, labels
+
+def open_store(pickle_file, store_dir, shape=None, sparse_labels=False):
+    '''
+    Opens all splits of the store, converting the pickle first if needed. Returns
+    train, valid and test (dataset, labels) pairs.
+    '''
+    if exists(store_dir, ('dataset', 'labels')) and not exists(store_dir, ('label_ids',)):
+        add_label_ids(store_dir)
+    if not exists(store_dir):
+        convert(pickle_file, store_dir)
+    return [load(store_dir, split, shape, sparse_labels) for split in splits]
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
+                            description='Converts the notMNIST pickle into a memory-mappable store.')
+    parser.add_argument('-i', '--pickle', default='../../data/notMNIST.pickle', help='notMNIST pickle')
+    parser.add_argument('-o', '--store', default='../../data/notMNIST_store', help='Output directory')
+    params = vars(parser.parse_args())
+    convert(params['pickle'], params['store'])
@@ -0,0 +1,106 @@
+'''
+Created on Oct 18, 2026
+
+Background prefetching of training batches, so that preparing the next batches on
+the CPU overlaps with session.run.
+
+@author: trucvietle
+'''
+
+import Queue
+import sys
+import threading
+import time
+
+class Prefetcher(object):
+    '''
+    Bounded producer/consumer queue in front of a batch source.
+
+    A background thread calls next_batch() (any zero-argument callable, e.g.
+    MinibatchIterator.next, BatchGenerator.next or a lambda around generate_batch) and
+    keeps up to depth batches ready. Batches are handed out in the order they were
+    produced. The source is only ever called from the producer thread, so stateful
+    sources keep working unchanged; sources that reuse their output buffers must keep
+    at least depth + 2 of them (one being filled, depth queued, one in use).
+
+    Since the producer runs ahead, the state of the source does not match what the
+    trainer has consumed. If get_state (the source's state getter) is given, it is
+    called after producing each batch and get_state() returns the state of the source
+    right after the last batch handed out, i.e. the state to resume from.
+
+    stalls counts how many times the trainer asked for a batch and had to wait for it,
+    and wait_time the total seconds spent waiting.
+    '''
+    def __init__(self, next_batch, depth=4, get_state=None):
+        assert depth > 0
+        self._next_batch = next_batch
+        self._get_state = get_state
+        self._state = get_state() if get_state is not None else None
+        self._queue = Queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self.requests = 0
+        self.stalls = 0
+        self.wait_time = 0.0
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch()
+                state = self._get_state() if self._get_state is not None else None
+                item = (True, (batch, state))
+            except Exception:
+                item = (False, sys.exc_info())
+            ## Block while the queue is full, but wake up regularly to honour close()
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except Queue.Full:
+                    pass
+            if not item[0]:
+                return
+
+    def next(self):
+        '''
+        Returns the next batch, waiting for the producer if none is ready.
+        '''
+        self.requests += 1
+        try:
+            ok, batch = self._queue.get_nowait()
+        except Queue.Empty:
+            self.stalls += 1
+            start = time.time()
+            ok, batch = self._queue.get()
+            self.wait_time += time.time() - start
+        if not ok:
+            ## Re-raise the producer's exception in the training thread
+            raise batch[0], batch[1], batch[2]
+        batch, self._state = batch
+        return batch
+
+    def get_state(self):
+        '''
+        State of the source after the last batch returned by next().
+        '''
+        return self._state
+
+    def __iter__(self):
+        return self
+
+    def close(self):
+        '''
+        Stops the producer thread.
+        '''
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self):
+        '''
+        Human readable summary of how often the trainer waited on data.
+        '''
+        ratio = 100.0 * self.stalls / max(self.requests, 1)
+        return 'Data stalls: %d of %d batches (%.1f%%), %.2fs waiting' % (
+            self.stalls, self.requests, ratio, self.wait_time)
@@ -0,0 +1,148 @@
+'''
+Created on Oct 18, 2026
+
+Fast 2-D projection of embeddings for visualization, scaling to the whole vocabulary.
+
+The embeddings are first reduced with PCA, then an approximate k-nearest-neighbour
+graph (cosine, from the LSH index of neighbours.py) is built on the reduced vectors
+and laid out in 2-D by stochastic gradient descent with negative sampling (in the
+spirit of LargeVis/UMAP): neighbours attract, random pairs repel. Each epoch is a
+handful of vectorized NumPy operations over all edges, and the layout stops early once
+its loss stops improving.
+
+@author: trucvietle
+'''
+
+import time
+import numpy as np
+import neighbours
+
+def pca(embeddings, num_components=50):
+    '''
+    Projects the rows onto their num_components principal components.
+    '''
+    centered = embeddings - embeddings.mean(0)
+    num_components = min(num_components, centered.shape[1])
+    ## The right singular vectors of the (small) covariance matrix
+    covariance = np.dot(centered.T, centered)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:num_components]
+    return np.dot(centered, eigenvectors[:, order]).astype(np.float32)
+
+def knn_graph(vectors, k=15, approximate=True, num_bits=10, num_tables=8, seed=None,
+              query_block=1024):
+    '''
+    k nearest neighbours (by cosine) of every row, from an LSHIndex if approximate, else
+    by exact blocked search. Returns [n, k] ids and the squared distances between the
+    normalized rows; missing neighbours (LSH rows with fewer than k candidates) have id
+    -1 and an infinite distance.
+    '''
+    n = vectors.shape[0]
+    normalized = vectors / np.maximum(np.sqrt(np.sum(vectors * vectors, 1)), 1e-8)[:, None]
+    normalized = normalized.astype(np.float32)
+    if approximate:
+        index = neighbours.LSHIndex(normalized, num_bits, num_tables, seed)
+    else:
+        index = neighbours.NearestNeighbours(normalized)
+    ids = np.empty((n, k), dtype=np.intp)
+    similarities = np.empty((n, k), dtype=np.float32)
+    for start in xrange(0, n, query_block):
+        stop = min(start + query_block, n)
+        ids[start:stop], similarities[start:stop] = index.query_ids(np.arange(start, stop), k)
+    ## |x - y|^2 = 2 - 2 x.y for unit vectors
+    sq_distances = np.where(ids >= 0, np.maximum(2.0 - 2.0 * similarities, 0.0), np.inf)
+    return ids, sq_distances
+
+def _scatter_add(values, index, n):
+    '''
+    Sums the rows of values into n rows by index (a much faster np.add.at).
+    '''
+    return np.column_stack([np.bincount(index, weights=values[:, d], minlength=n)
+                            for d in xrange(values.shape[1])])
+
+def layout(ids, sq_distances, init, num_epochs=200, negative_samples=5, learning_rate=1.0,
+           tolerance=0.01, patience=10, num_decays=4, random=None, verbose=True):
+    '''
+    Optimizes 2-D coordinates (starting from init) so that graph neighbours are close.
+    The step size decays linearly over the budget of num_epochs and is also halved
+    whenever the loss plateaus, i.e. when its mean over the last patience epochs is less
+    than tolerance (relative) below its mean over the patience epochs before. The layout
+    stops early at the plateau following num_decays halvings. Edges with id -1 are
+    ignored.
+    '''
+    random = np.random.RandomState(random)
+    n, k = ids.shape
+    ## Edge weights from a per-point Gaussian kernel scaled by the distance to the
+    ## farthest neighbour found
+    finite = np.where(np.isfinite(sq_distances), sq_distances, 0.0)
+    sigmas = np.maximum(np.sqrt(finite.max(1)), 1e-8)
+    weights = np.exp(-sq_distances / (sigmas[:, None] ** 2))
+    present = (ids >= 0).ravel()
+    heads = np.repeat(np.arange(n), k)[present]
+    tails = ids.ravel()[present]
+    ## Each epoch visits each edge with probability proportional to its weight
+    edge_probabilities = (weights / weights.max()).ravel()[present]
+    y = init.astype(np.float64)
+    y = 10.0 * (y - y.mean(0)) / (y.std(0) + 1e-8)
+    scale = 1.0
+    ## The losses at the current scale; the first patience epochs are skipped while the
+    ## initial scaling settles
+    losses = list()
+    skip = patience
+    for epoch in xrange(num_epochs):
+        alpha = learning_rate * scale * (1.0 - epoch / float(num_epochs))
+        active = random.random_sample(len(heads)) < edge_probabilities
+        h = heads[active]
+        t = tails[active]
+        ## Attraction along the sampled edges
+        diff = y[h] - y[t]
+        sq = np.sum(diff * diff, 1)
+        loss = np.mean(np.log1p(sq))
+        grad = np.clip(-2.0 * diff / (1.0 + sq)[:, None], -4, 4)
+        step = _scatter_add(grad, h, n) - _scatter_add(grad, t, n)
+        ## Repulsion from random points
+        hn = np.repeat(h, negative_samples)
+        negatives = random.randint(0, n, size=len(hn))
+        diff = y[hn] - y[negatives]
+        sq = np.sum(diff * diff, 1)
+        loss -= negative_samples * np.mean(np.log(sq / (1.0 + sq) + 0.001))
+        grad = np.clip(2.0 * diff / ((0.001 + sq) * (1.0 + sq))[:, None], -4, 4)
+        step += _scatter_add(grad, hn, n)
+        y += alpha * step
+        ## The loss of the sampled edges, before this epoch's step
+        losses.append(loss)
+        if verbose and epoch % 20 == 0:
+            print 'Layout epoch %d: loss %.4f, step size %.4f' % (epoch, loss, alpha)
+        if len(losses) >= skip + 2 * patience:
+            previous = np.mean(losses[-2 * patience:-patience])
+            if previous - np.mean(losses[-patience:]) < tolerance * abs(previous):
+                if scale <= 0.5 ** num_decays:
+                    if verbose:
+                        print 'Layout converged after %d epochs (loss %.4f)' % (epoch + 1, loss)
+                    break
+                scale *= 0.5
+                losses = list()
+                skip = 0
+    return y.astype(np.float32)
+
+def project(embeddings, num_components=50, k=15, num_epochs=200, random=None, verbose=True):
+    '''
+    2-D coordinates for every row of embeddings: PCA, kNN graph, then layout.
+    '''
+    start = time.time()
+    reduced = pca(embeddings, num_components)
+    ids, sq_distances = knn_graph(reduced, k, seed=random)
+    if verbose:
+        print 'PCA and %d-NN graph of %d points: %.1fs' % (k, len(embeddings), time.time() - start)
+    coordinates = layout(ids, sq_distances, reduced[:, :2], num_epochs, random=random, verbose=verbose)
+    if verbose:
+        print 'Projection done in %.1fs' % (time.time() - start)
+    return coordinates
+
+def save_coordinates(filename, coordinates, words):
+    '''
+    Writes 'word<TAB>x<TAB>y' lines.
+    '''
+    with open(filename, 'w') as f:
+        for word, (x, y) in zip(words, coordinates):
+            f.write('%s\t%.5f\t%.5f\n' % (word, x, y))
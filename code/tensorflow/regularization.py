@@ -4,49 +4,35 @@ Created on Feb 5, 2016
 @author: trucvietle
 '''
 
-import cPickle as pickle
 import numpy as np
 import tensorflow as tf
-
-## Load the notMNIST data generated from Lesson 1
-pickle_file = '../../data/notMNIST.pickle'
-with open(pickle_file, 'rb') as f:
-    save = pickle.load(f)
-    train_dataset = save['train_dataset']
-    train_labels = save['train_labels']
-    valid_dataset = save['valid_dataset']
-    valid_labels = save['valid_labels']
-    test_dataset = save['test_dataset']
-    test_labels = save['test_labels']
-    del save # hit to help gc save up memory
-    print 'Training set', train_dataset.shape, train_labels.shape
-    print 'Validation set', valid_dataset.shape, valid_labels.shape
-    print 'Test set', test_dataset.shape, test_labels.shape
+import notmnist_store
+import minibatch
+import prefetch
+import evaluation
+import metrics
+import checkpoint
 
 ## Reformat into shape that's more adapted to the models we're going to train
 ## - Data as flat matrix
-## - Labels as float 1-hot encodings
+## - Labels as uint8 label ids (sparse_labels) or as float 1-hot encodings
 image_size = 28
 num_labels = 10
+sparse_labels = True
+class_names = 'ABCDEFGHIJ'
 
-def reformat(dataset, labels):
-    dataset = dataset.reshape((-1, image_size*image_size)).astype(np.float32)
-    ## Map 0 to [1.0, 0.0, 0.0, ...], 1 to [0.0, 1.0, 0.0, ...]
-    labels = (np.arange(num_labels) == labels[:, None]).astype(np.float32)
-    return dataset, labels
-
-train_dataset, train_labels = reformat(train_dataset, train_labels)
-valid_dataset, valid_labels = reformat(valid_dataset, valid_labels)
-test_dataset, test_labels = reformat(test_dataset, test_labels)
+## Load the notMNIST data generated from Lesson 1, memory-mapped from the store that
+## notmnist_store.py converts the pickle into on the first run
+pickle_file = '../../data/notMNIST.pickle'
+store_dir = '../../data/notMNIST_store'
+(train_dataset, train_labels), (valid_dataset, valid_labels), (test_dataset, test_labels) = \
+    notmnist_store.open_store(pickle_file, store_dir, shape=(-1, image_size*image_size),
+                              sparse_labels=sparse_labels)
 
 print 'Training set', train_dataset.shape, train_labels.shape
 print 'Validation set', valid_dataset.shape, valid_labels.shape
 print 'Test set', test_dataset.shape, test_labels.shape
 
-def accuracy(pred, labels):
-    return(100.0 * np.sum(np.argmax(pred, 1) == np.argmax(labels, 1))
-           / pred.shape[0])
-
 ## Introduce and tune L2 regularization for both logistic and NN models.
 batch_size = 128
 graph = tf.Graph()
@@ -54,9 +40,7 @@ with graph.as_default():
     ## Input data. For the training data, use a placeholder that will be fed at runtime with
     ## a training mini-batch
     tf_train_dataset = tf.placeholder(tf.float32, shape=(batch_size, image_size*image_size))
-    tf_train_labels = tf.placeholder(tf.float32, shape=(batch_size, num_labels))
-    tf_valid_dataset = tf.constant(valid_dataset)
-    tf_test_dataset = tf.constant(test_dataset)
+    tf_train_labels = metrics.label_placeholder(batch_size, num_labels, sparse_labels)
     
 #     ## Variables
 #     weights = tf.Variable(tf.truncated_normal([image_size*image_size, num_labels]))
@@ -66,7 +50,7 @@ with graph.as_default():
 #     logits = tf.matmul(tf_train_dataset, weights) + biases
 #     ## Add regularizer
 #     logits = logits + tf.nn.l2_loss(weights)
-#     loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits, tf_train_labels))
+#     loss = metrics.cross_entropy(logits, tf_train_labels)
     
     ## Now: Change to one-layer NN
     ## Variables
@@ -78,50 +62,77 @@ with graph.as_default():
     ## Output layer
     weights_o = tf.Variable(tf.truncated_normal([hidden_layer_size, num_labels]))
     biases_o = tf.Variable(tf.zeros([num_labels]))
-    ## Add dropout
-    hidden_dropout = tf.nn.dropout(hidden, keep_prob=0.50)
+    ## Add dropout. The keep mask is drawn with NumPy and fed, rather than drawn by
+    ## tf.nn.dropout, so that it comes from the random state the checkpoints restore
+    keep_prob = 0.50
+    tf_keep_mask = tf.placeholder(tf.bool, shape=(batch_size, hidden_layer_size))
+    hidden_dropout = hidden * tf.cast(tf_keep_mask, tf.float32) / keep_prob
     logits = tf.matmul(hidden_dropout, weights_o) + biases_o
     ## Add regularization
     logits = logits + tf.nn.l2_loss(weights_o)
-    loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits, tf_train_labels))
+    loss = metrics.cross_entropy(logits, tf_train_labels)
     ## END CHANGE
     
     ## Optimizer
     optimizer = tf.train.GradientDescentOptimizer(0.50).minimize(loss)
     
-    ## Prediction for training, validation and test data
-    train_pred = tf.nn.softmax(logits)
-#     valid_pred = tf.nn.softmax(tf.matmul(tf_valid_dataset, weights) + biases)
-#     test_pred = tf.nn.softmax(tf.matmul(tf_test_dataset, weights) + biases)
+    ## Correct count on the training data; validation and test data are streamed in chunks
+    ## through the model without dropout and regularization
+    train_correct = metrics.num_correct(logits, tf_train_labels)
     
-    valid_hidden = tf.nn.relu(tf.matmul(tf_valid_dataset, weights_h) + biases_h)
-    valid_logits = tf.matmul(valid_hidden, weights_o) + biases_o
-    valid_pred = tf.nn.softmax(valid_logits)
-     
-    test_hidden = tf.nn.relu(tf.matmul(tf_test_dataset, weights_h) + biases_h)
-    test_logits = tf.matmul(test_hidden, weights_o) + biases_o
-    test_pred = tf.nn.softmax(test_logits)
+    def model(data):
+        hidden = tf.nn.relu(tf.matmul(data, weights_h) + biases_h)
+        return tf.matmul(hidden, weights_o) + biases_o
+    
+    evaluator = evaluation.ChunkedEvaluator(model, [image_size*image_size], num_labels,
+                                            sparse_labels=sparse_labels)
+    
+    ## Periodic checkpoints of all variables, written in the background
+    checkpoints = checkpoint.CheckpointManager('../../data/checkpoints/regularization', max_to_keep=3)
 
 ## Let's run it
 num_steps = 3001
+checkpoint_every = 1000
+
+## Prepare the next mini-batches in the background while the session runs
+prefetch_depth = 4
+batch_iterator = minibatch.MinibatchIterator(train_dataset, train_labels, batch_size,
+                                             num_buffers=prefetch_depth + 2)
+## Resume the batch order from the latest checkpoint, if any
+data_state = checkpoints.load()
+if data_state is not None:
+    batch_iterator.set_state(data_state)
+train_batches = prefetch.Prefetcher(batch_iterator.next, depth=prefetch_depth,
+                                    get_state=batch_iterator.get_state)
 
+print 'Label bytes fed per step:', train_labels[:batch_size].nbytes
+train_metrics = metrics.StreamingMetrics(num_labels)
 with tf.Session(graph=graph) as session:
     tf.initialize_all_variables().run()
     print 'Initialized'
-    for step in xrange(num_steps):
-        ## Pick an offset within the training data, which has been randomized
-        ## Note: We could use better randomization across the epochs
-        offset = (step * batch_size) % (train_labels.shape[0] - batch_size)
-        ## Generate a mini-batch
-        batch_data = train_dataset[offset:(offset + batch_size), :]
-        batch_labels = train_labels[offset:(offset + batch_size), :]
+    for step in xrange(checkpoints.restore(session), num_steps):
+        ## Generate a mini-batch, reshuffled every epoch
+        batch_data, batch_labels = train_batches.next()
         ## Prepare a dict telling the session where to feed the mini-batch
         ## The key of the dict is the placeholder node of the graph to be fed
         ## and the value is the numpy array to feed to it.
-        feed_dict = {tf_train_dataset : batch_data, tf_train_labels : batch_labels}
-        _, l, pred = session.run([optimizer, loss, train_pred], feed_dict=feed_dict)
+        keep_mask = np.random.random_sample((batch_size, hidden_layer_size)) < keep_prob
+        feed_dict = {tf_train_dataset : batch_data, tf_train_labels : batch_labels,
+                     tf_keep_mask : keep_mask}
+        ## Only the loss and the number of correct predictions come back from the session
+        _, l, correct = session.run([optimizer, loss, train_correct], feed_dict=feed_dict)
+        train_metrics.update(batch_size, correct, l)
         if (step % 500 == 0):
             print 'Mini-batch loss at step', step, ':', l
-            print 'Mini-batch accuracy: %.1f%%' % accuracy(pred, batch_labels)
-            print 'Validation accuracy: %.1f%%' % accuracy(valid_pred.eval(), valid_labels)
-    print 'Test accuracy: %.1f%%' % accuracy(test_pred.eval(), test_labels)
+            print 'Mini-batch accuracy since last report: %.1f%%' % train_metrics.accuracy()
+            train_metrics.reset()
+            print 'Validation accuracy: %.1f%%' % evaluator.accuracy(valid_dataset, valid_labels)
+        if (step + 1) % checkpoint_every == 0 or step == num_steps - 1:
+            checkpoints.save(session, step + 1, train_batches.get_state())
+    train_batches.close()
+    checkpoints.close()
+    print train_batches.stats()
+    print checkpoints.stats()
+    test_metrics = evaluator.evaluate(test_dataset, test_labels)
+    print 'Test accuracy: %.1f%%' % test_metrics.accuracy()
+    print test_metrics.report(class_names)
@@ -0,0 +1,155 @@
+'''
+Created on Oct 18, 2026
+
+Vectorized sampling from categorical distributions.
+
+All functions take a random argument that can be None (the global NumPy stream), an
+int seed or a np.random.RandomState, so independent seeded streams can be used side
+by side.
+
+@author: trucvietle
+'''
+
+import random as py_random
+import time
+import numpy as np
+
+def get_random(random=None):
+    '''
+    Turns None, a seed or a RandomState into something to draw from. An int seed starts
+    a new stream on every call, so callers drawing repeatedly should convert it once and
+    pass the returned RandomState on.
+    '''
+    if random is None:
+        return np.random
+    if isinstance(random, (int, long)):
+        return np.random.RandomState(random)
+    return random
+
+def categorical(distributions, random=None):
+    '''
+    Samples one id from each row of a [batch, classes] array of normalized probabilities.
+    '''
+    distributions = np.atleast_2d(distributions)
+    r = get_random(random).random_sample(size=(distributions.shape[0], 1))
+    ## Index of the first cumulative probability >= r in each row
+    ids = np.sum(np.cumsum(distributions, 1) < r, 1)
+    return np.minimum(ids, distributions.shape[1] - 1)
+
+def top_k_filter(distributions, k):
+    '''
+    Keeps the k most likely classes of each row and renormalizes.
+    '''
+    distributions = np.atleast_2d(distributions)
+    if k >= distributions.shape[1]:
+        return distributions
+    drop = np.argpartition(distributions, -k, axis=1)[:, :-k]
+    filtered = distributions.copy()
+    filtered[np.arange(filtered.shape[0])[:, None], drop] = 0.0
+    return filtered / np.sum(filtered, 1)[:, None]
+
+def nucleus_filter(distributions, top_p):
+    '''
+    Keeps, in each row, the smallest set of most likely classes whose total probability
+    reaches top_p, and renormalizes.
+    '''
+    distributions = np.atleast_2d(distributions)
+    order = np.argsort(-distributions, axis=1)
+    rows = np.arange(distributions.shape[0])[:, None]
+    sorted_probs = distributions[rows, order]
+    ## A class is kept if the probability mass before it is still below top_p
+    keep = (np.cumsum(sorted_probs, 1) - sorted_probs) < top_p
+    filtered = np.zeros_like(distributions)
+    filtered[rows, order] = np.where(keep, sorted_probs, 0.0)
+    return filtered / np.sum(filtered, 1)[:, None]
+
+def one_hot(ids, num_classes, out=None):
+    '''
+    One-hot encodes a vector of ids as float32, reusing out (of shape
+    [len(ids), num_classes]) when given.
+    '''
+    if out is None:
+        out = np.zeros(shape=(len(ids), num_classes), dtype=np.float32)
+    else:
+        out.fill(0.0)
+    out[np.arange(len(ids)), ids] = 1.0
+    return out
+
+class AliasTable(object):
+    '''
+    Walker/Vose alias table: O(n) to build once, then O(1) per sample from a fixed
+    distribution, e.g. a unigram table for negative sampling.
+    '''
+    def __init__(self, probabilities):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        n = len(probabilities)
+        scaled = probabilities * (n / np.sum(probabilities))
+        self._prob = np.ones(n)
+        self._alias = np.arange(n)
+        small = list(np.nonzero(scaled < 1.0)[0])
+        large = list(np.nonzero(scaled >= 1.0)[0])
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        ## Whatever is left is 1 up to rounding errors
+        self.probabilities = probabilities / np.sum(probabilities)
+
+    def sample(self, size, random=None):
+        '''
+        Draws size ids.
+        '''
+        random = get_random(random)
+        columns = random.randint(0, len(self._prob), size=size)
+        accept = random.random_sample(size=size) < self._prob[columns]
+        return np.where(accept, columns, self._alias[columns])
+
+def benchmark(vocabulary_size=27, batch_size=64, repeats=2000):
+    '''
+    Compares categorical() with the former per-row Python loop of lstm.py.
+    '''
+    def sample_distribution(distribution):
+        r = py_random.uniform(0, 1)
+        s = 0
+        for i in xrange(len(distribution)):
+            s += distribution[i]
+            if s >= r:
+                return i
+        return len(distribution) - 1
+
+    def sample(prediction):
+        p = np.zeros(shape=[1, vocabulary_size], dtype=np.float)
+        p[0, sample_distribution(prediction[0])] = 1.0
+        return p
+
+    b = np.random.uniform(0.0, 1.0, size=[batch_size, vocabulary_size])
+    distributions = b / np.sum(b, 1)[:, None]
+    start = time.time()
+    for _ in xrange(repeats):
+        for row in distributions:
+            sample(row[None, :])
+    loop_time = time.time() - start
+    out = np.zeros(shape=distributions.shape, dtype=np.float32)
+    random = np.random.RandomState(0)
+    start = time.time()
+    for _ in xrange(repeats):
+        one_hot(categorical(distributions, random), vocabulary_size, out)
+    vectorized_time = time.time() - start
+    table = AliasTable(distributions[0])
+    start = time.time()
+    for _ in xrange(repeats):
+        table.sample(batch_size, random)
+    alias_time = time.time() - start
+    samples = repeats * batch_size
+    print 'Python loop: %.0f samples/second' % (samples / loop_time)
+    print 'Vectorized:  %.0f samples/second' % (samples / vectorized_time)
+    print 'Alias table: %.0f samples/second' % (samples / alias_time)
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,69 @@
+'''
+Created on Oct 18, 2026
+
+Corpus preprocessing for word2vec: subsampling of frequent words and a unigram^0.75
+table for negative sampling (Mikolov et al., 2013).
+
+@author: trucvietle
+'''
+
+import numpy as np
+import sampling
+
+def keep_probabilities(count, threshold=1e-5):
+    '''
+    Probability of keeping each occurrence of every word id, given the count table of
+    build_dataset. A word with frequency f is kept with probability
+    (sqrt(f / threshold) + 1) * threshold / f, capped at 1, as in the word2vec C code.
+    '''
+    counts = np.array([c for _, c in count], dtype=np.float64)
+    frequencies = counts / np.sum(counts)
+    frequencies[frequencies == 0] = 1.0
+    keep = (np.sqrt(frequencies / threshold) + 1) * threshold / frequencies
+    return np.minimum(keep, 1.0)
+
+def subsample(data, count, threshold=1e-5, random=None):
+    '''
+    Drops occurrences of frequent words from the int32 corpus. Returns the subsampled
+    corpus and the fraction of tokens kept.
+    '''
+    keep = keep_probabilities(count, threshold)
+    random = sampling.get_random(random)
+    kept = np.empty(len(data), dtype=np.int32)
+    size = 0
+    ## In blocks, to bound the temporaries for a memory-mapped corpus
+    block_size = 1 << 22
+    for start in xrange(0, len(data), block_size):
+        block = np.asarray(data[start:start + block_size])
+        block = block[random.random_sample(len(block)) < keep[block]]
+        kept[size:size + len(block)] = block
+        size += len(block)
+    return kept[:size].copy(), size / float(len(data))
+
+class NegativeSampler(object):
+    '''
+    Draws the negative classes of sampled_softmax_loss from the unigram distribution
+    raised to the given power, through a precomputed alias table. sample() returns the
+    (sampled_candidates, true_expected_count, sampled_expected_count) triple that
+    sampled_softmax_loss accepts as sampled_values.
+    '''
+    def __init__(self, count, num_sampled, power=0.75, random=None):
+        counts = np.array([c for _, c in count], dtype=np.float64)
+        self._table = sampling.AliasTable(counts ** power)
+        self._num_sampled = num_sampled
+        self._random = sampling.get_random(random)
+        ## Expected number of times each class shows up among the num_sampled draws
+        self._expected_count = (num_sampled * self._table.probabilities).astype(np.float32)
+
+    def sample(self, labels):
+        '''
+        Negatives for a [batch_size, 1] array of true labels.
+        '''
+        candidates = self._table.sample(self._num_sampled, self._random).astype(np.int64)
+        return (candidates, self._expected_count[labels], self._expected_count[candidates])
+
+    def get_state(self):
+        return self._random.get_state()
+
+    def set_state(self, state):
+        self._random.set_state(state)
@@ -0,0 +1,120 @@
+'''
+Created on Oct 18, 2026
+
+Streaming reader and encoder for the Text8 data.
+
+The zip member is decompressed in chunks and each chunk is tokenized on its own, so
+the whole text is never held as one string nor as a list of ~17M word strings.
+
+@author: trucvietle
+'''
+
+import collections
+import zipfile
+import numpy as np
+
+chunk_size = 1 << 20 # bytes of decompressed text per chunk
+
+def iter_chunks(filename, chunk_size=chunk_size):
+    '''
+    Yields the text of the (first) member of the zip file in chunks.
+    '''
+    f = zipfile.ZipFile(filename)
+    try:
+        member = f.open(f.namelist()[0])
+        while True:
+            chunk = member.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        member.close()
+    finally:
+        f.close()
+
+def iter_word_chunks(filename, chunk_size=chunk_size):
+    '''
+    Yields lists of the words of the zip member, one (small) list per chunk. A word
+    cut by a chunk boundary is carried over to the next chunk.
+    '''
+    tail = ''
+    for chunk in iter_chunks(filename, chunk_size):
+        words = (tail + chunk).split()
+        if chunk[-1:].isspace() or not words:
+            tail = ''
+        else:
+            tail = words.pop()
+        yield words
+    if tail:
+        yield [tail]
+
+def count_words(filename):
+    '''
+    Counts the occurrences of every word.
+    '''
+    counter = collections.Counter()
+    for words in iter_word_chunks(filename):
+        counter.update(words)
+    return counter
+
+def build_dataset(filename, vocabulary_size):
+    '''
+    Builds the dictionary of the vocabulary_size - 1 most common words (plus 'UNK' for
+    all the others) and encodes the text into an int32 array of word ids.
+
+    Returns data, count, dictionary, reverse_dictionary as the former word2vec
+    build_dataset did, with data an int32 NumPy array instead of a list.
+    '''
+    counter = count_words(filename)
+    num_words = sum(counter.itervalues())
+    count = [['UNK', -1]]
+    count.extend(counter.most_common(vocabulary_size - 1))
+    del counter
+    dictionary = dict()
+    for word, _ in count:
+        dictionary[word] = len(dictionary)
+    count[0][1] = num_words - sum(c for _, c in count[1:])
+
+    ## Second pass: encode chunk by chunk straight into the preallocated corpus array
+    data = np.empty(num_words, dtype=np.int32)
+    get = dictionary.get
+    offset = 0
+    for words in iter_word_chunks(filename):
+        n = len(words)
+        data[offset:offset + n] = np.fromiter((get(word, 0) for word in words), dtype=np.int32, count=n)
+        offset += n
+    assert offset == num_words
+    reverse_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
+    return data, count, dictionary, reverse_dictionary
+
+## Character ids as used by the LSTM model: ' ' (and anything unexpected) is 0, [a-z] are 1..26
+char_vocabulary_size = 27
+char_table = np.zeros(256, dtype=np.uint8)
+char_table[ord('a'):ord('z') + 1] = np.arange(1, 27)
+
+def encode_chars(text):
+    '''
+    Encodes a string into a uint8 array of character ids.
+    '''
+    return char_table[np.frombuffer(text, dtype=np.uint8)]
+
+def decode_chars(ids):
+    '''
+    Decodes an array of character ids back into a string.
+    '''
+    ids = np.asarray(ids, dtype=np.uint8)
+    return np.where(ids > 0, ids + (ord('a') - 1), ord(' ')).astype(np.uint8).tostring()
+
+def build_char_dataset(filename):
+    '''
+    Encodes the text of the zip member into a uint8 array of character ids, chunk by chunk.
+    '''
+    f = zipfile.ZipFile(filename)
+    size = f.getinfo(f.namelist()[0]).file_size
+    f.close()
+    data = np.empty(size, dtype=np.uint8)
+    offset = 0
+    for chunk in iter_chunks(filename):
+        data[offset:offset + len(chunk)] = encode_chars(chunk)
+        offset += len(chunk)
+    assert offset == size
+    return data
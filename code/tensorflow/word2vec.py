@@ -1,93 +1,51 @@
 '''
 Created on Mar 8, 2016
 
-Train a skip-gram model on Text8 data and visualize the output.
+Train a skip-gram or CBOW model on Text8 data and visualize the output.
 
 @author: trucvietle
 '''
 
-import collections
-import zipfile
 import random
 import math
-from sklearn.manifold import TSNE
+import time
+import matplotlib
+matplotlib.use('Agg') # render to files, no display needed
 from matplotlib import pylab
 import tensorflow as tf
 import numpy as np
+import prefetch
+import word_batches
+import corpus_cache
+import neighbours
+import embedding_store
+import subsampling
+import projection
+import checkpoint
 
-## Read the data into a string
-def read_data(filename):
-    f = zipfile.ZipFile(filename)
-    for name in f.namelist():
-        return f.read(name).split()
-    f.close()
-
+## Encode the data into an int32 array of word ids, replacing rare words with UNK token.
+## The encoded corpus is cached, so only the first run reads and tokenizes the zip.
 filename = '../../data/text8.zip'
-words = read_data(filename)
-print 'Data size', len(words)
-
-## Build the dictionary and replace rare words with UNK token
 vocabulary_size = 50000
-def build_dataset(words):
-    count = [['UNK', -1]]
-    count.extend(collections.Counter(words).most_common(vocabulary_size-1))
-    dictionary = dict()
-    for word, _ in count:
-        dictionary[word] = len(dictionary)
-    data = list()
-    unk_count = 0
-    for word in words:
-        if word in dictionary:
-            index = dictionary[word]
-        else:
-            index = 0 # dictionary['UNK']
-            unk_count += 1
-        data.append(index)
-    count[0][1] = unk_count
-    reverse_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
-    return data, count, dictionary, reverse_dictionary
-
-data, count, dictionary, reverse_dictionary = build_dataset(words)
+data, count, dictionary, reverse_dictionary = corpus_cache.load_word_corpus(filename, vocabulary_size)
+print 'Data size', len(data)
 print 'Most common words (+UNK)', count[:5]
 print 'Sample data', data[:10]
-del words # to reduce memory
-
-## Function to generate a training batch for the skip-gram model
-data_index = 0
-def generate_batch(batch_size, num_skips, skip_window):
-    global data_index
-    assert batch_size % num_skips == 0
-    assert num_skips <= 2 * skip_window
-    batch = np.ndarray(shape=(batch_size), dtype=np.int32)
-    labels = np.ndarray(shape=(batch_size, 1), dtype=np.int32)
-    span = 2 * skip_window + 1 # [skip_window target skip_window]
-    buffer = collections.deque(maxlen=span)
-    for _ in range(span):
-        buffer.append(data[data_index])
-        data_index = (data_index + 1) % len(data)
-    for i in range(batch_size / num_skips):
-        target = skip_window # target label at the center of the buffer
-        targets_to_avoid = [skip_window]
-        for j in range(num_skips):
-            while target in targets_to_avoid:
-                target = random.randint(0, span-1)
-            targets_to_avoid.append(target)
-            batch[i * num_skips + j] = buffer[skip_window]
-            labels[i * num_skips + j, 0] = buffer[target]
-        buffer.append(data[data_index])
-        data_index = (data_index + 1) % len(data)
-    return batch, labels
-
-batch, labels = generate_batch(batch_size=8, num_skips=2, skip_window=1)
+
+## Generate training batches for the skip-gram model with array indexing over the corpus
+batch, labels = word_batches.SkipGramBatcher(data, batch_size=8, num_skips=2, skip_window=1).next()
 for i in range(8):
     print batch[i], '->', labels[i, 0]
     print reverse_dictionary[batch[i]], '->', reverse_dictionary[labels[i, 0]]
 
-## Train a skip-gram model
+## Train a skip-gram or a CBOW model. Skip-gram predicts each context word from the
+## center word, reusing each center num_skips times. CBOW predicts the center word from
+## the average of its 2 * skip_window context embeddings, one example per center word.
+model = 'skipgram' # 'skipgram' or 'cbow'
 batch_size = 128
 embedding_size = 128 # dimension of the embedding vector
 skip_window = 1 # how many words to consider left and right
-num_skips = 2 # how many times to reuse an input to generate a label
+num_skips = 2 # how many times to reuse an input to generate a label (skip-gram only)
 
 ## We pick a random validation set to sample nearest neighbors. Here we limit the
 ## validation samples to the words that have a low numeric ID, which by construction
@@ -97,12 +55,32 @@ valid_window = 100 # only pick dev samples in the head of the distribution
 valid_examples = np.array(random.sample(xrange(valid_window), valid_size))
 num_sampled = 64 # number of negative examples in the sample
 
+## Subsample frequent words ("the", "of", ...) and draw negatives from unigram^0.75
+## through a precomputed alias table. Set subsample_threshold to None to train on
+## every token. The data pipeline uses seeded random streams, so that a run resumed
+## from a checkpoint trains on the same subsampled corpus.
+data_seed = 0
+subsample_threshold = 1e-5
+train_data = data
+kept_fraction = 1.0
+if subsample_threshold is not None:
+    train_data, kept_fraction = subsampling.subsample(data, count, subsample_threshold, random=data_seed)
+    print 'Subsampled corpus: %d tokens (%.1f%% kept)' % (len(train_data), 100 * kept_fraction)
+negative_sampler = subsampling.NegativeSampler(count, num_sampled, random=data_seed + 1)
+
 graph = tf.Graph()
 
 with graph.as_default():
     ## Input data
-    train_dataset = tf.placeholder(tf.int32, shape=[batch_size])
+    if model == 'cbow':
+        train_dataset = tf.placeholder(tf.int32, shape=[batch_size, 2 * skip_window])
+    else:
+        train_dataset = tf.placeholder(tf.int32, shape=[batch_size])
     train_labels = tf.placeholder(tf.int32, shape=[batch_size, 1])
+    ## Negative samples drawn on the Python side, with their expected counts
+    sampled_candidates = tf.placeholder(tf.int64, shape=[num_sampled])
+    true_expected_count = tf.placeholder(tf.float32, shape=[batch_size, 1])
+    sampled_expected_count = tf.placeholder(tf.float32, shape=[num_sampled])
     valid_dataset = tf.constant(valid_examples, dtype=tf.int32)
     
     ## Variables
@@ -114,13 +92,21 @@ with graph.as_default():
     ## Model
     ## Look up embeddings for inputs
     embed = tf.nn.embedding_lookup(embeddings, train_dataset)
+    if model == 'cbow':
+        ## Average the context embeddings into one input per center word
+        embed = tf.reduce_mean(embed, 1)
     ## Compute the softmax loss, using a sample of the negative labels each time
+    sampled_values = (sampled_candidates, true_expected_count, sampled_expected_count)
     loss = tf.reduce_mean(tf.nn.sampled_softmax_loss(softmax_weights, softmax_biases, embed,
-                                                     train_labels, num_sampled, vocabulary_size))
+                                                     train_labels, num_sampled, vocabulary_size,
+                                                     sampled_values=sampled_values))
     
     ## Optimizer
     optimizer = tf.train.AdagradOptimizer(1.0).minimize(loss)
     
+    ## Periodic checkpoints of the variables and Adagrad accumulators, written in the background
+    checkpoints = checkpoint.CheckpointManager('../../data/checkpoints/word2vec_%s' % model, max_to_keep=3)
+    
     ## Compute the similarity between minibatch examples and all embeddings
     ## We use cosine distance
     norm = tf.sqrt(tf.reduce_sum(tf.square(embeddings), 1, keep_dims=True))
@@ -129,48 +115,174 @@ with graph.as_default():
     similarity = tf.matmul(valid_embeddings, tf.transpose(normalized_embeddings))
     
 num_steps = 100001
+checkpoint_every = 10000
+
+def make_batcher(corpus, seed):
+    '''
+    Batches of the configured model over corpus.
+    '''
+    if model == 'cbow':
+        return word_batches.CBOWBatcher(corpus, batch_size, skip_window)
+    return word_batches.SkipGramBatcher(corpus, batch_size, num_skips, skip_window, seed=seed)
+
+## Generate the next batches in the background while the session runs
+train_batches = make_batcher(train_data, data_seed + 2)
+centers_per_step = batch_size if model == 'cbow' else batch_size / num_skips
+
+def next_batch():
+    '''
+    A training batch with its negative samples.
+    '''
+    batch_data, batch_labels = train_batches.next()
+    return (batch_data, batch_labels) + negative_sampler.sample(batch_labels)
+
+def data_state():
+    return {'batches': train_batches.get_state(), 'negatives': negative_sampler.get_state()}
+
+## Optionally measure the convergence speedup of subsampling per wall-clock second
+## before the real training: fresh models are trained on the full and on the subsampled
+## corpus, both scored on the same fixed batches of the full corpus. The speedup is the
+## ratio of the training times needed to reach the evaluation loss the full-corpus model
+## ends with.
+compare_subsampling = False
+race_steps = 20000
+race_eval_every = 1000
+race_eval_batches = 20
+
+def convergence_curve(session, corpus, eval_feeds):
+    '''
+    Trains fresh variables for race_steps on corpus. Returns the training time (excluding
+    evaluations) and the mean evaluation loss after every race_eval_every steps.
+    '''
+    tf.initialize_all_variables().run()
+    batcher = make_batcher(corpus, data_seed + 3)
+    sampler = subsampling.NegativeSampler(count, num_sampled, random=data_seed + 4)
+    curve = list()
+    seconds = 0.0
+    for step in xrange(1, race_steps + 1):
+        batch_data, batch_labels = batcher.next()
+        candidates, true_expected, sampled_expected = sampler.sample(batch_labels)
+        start = time.time()
+        session.run(optimizer, {train_dataset : batch_data, train_labels : batch_labels,
+                                sampled_candidates : candidates, true_expected_count : true_expected,
+                                sampled_expected_count : sampled_expected})
+        seconds += time.time() - start
+        if step % race_eval_every == 0:
+            curve.append((seconds, np.mean([loss.eval(f) for f in eval_feeds])))
+    return curve
+
+def time_to_reach(curve, target):
+    for seconds, eval_loss in curve:
+        if eval_loss <= target:
+            return seconds
+    return None
+
+if compare_subsampling and subsample_threshold is not None:
+    eval_batches = make_batcher(data, data_seed + 5)
+    eval_sampler = subsampling.NegativeSampler(count, num_sampled, random=data_seed + 6)
+    eval_feeds = list()
+    for _ in xrange(race_eval_batches):
+        batch_data, batch_labels = eval_batches.next()
+        candidates, true_expected, sampled_expected = eval_sampler.sample(batch_labels)
+        eval_feeds.append({train_dataset : batch_data, train_labels : batch_labels,
+                           sampled_candidates : candidates, true_expected_count : true_expected,
+                           sampled_expected_count : sampled_expected})
+    with tf.Session(graph=graph) as session:
+        full_curve = convergence_curve(session, data, eval_feeds)
+        subsampled_curve = convergence_curve(session, train_data, eval_feeds)
+    target = full_curve[-1][1]
+    full_time = time_to_reach(full_curve, target)
+    subsampled_time = time_to_reach(subsampled_curve, target)
+    print 'Evaluation loss after %d steps: full corpus %.4f (%.1fs), subsampled %.4f (%.1fs)' % (
+        race_steps, target, full_curve[-1][0], subsampled_curve[-1][1], subsampled_curve[-1][0])
+    if subsampled_time is None:
+        print 'Subsampled training did not reach %.4f within %d steps' % (target, race_steps)
+    else:
+        print 'Time to an evaluation loss of %.4f: full corpus %.1fs, subsampled %.1fs (%.2fx speedup)' % (
+            target, full_time, subsampled_time, full_time / max(subsampled_time, 1e-6))
+
+## Resume the batch cursor and the negative sampling stream from the latest checkpoint
+resume_state = checkpoints.load()
+if resume_state is not None:
+    train_batches.set_state(resume_state['batches'])
+    negative_sampler.set_state(resume_state['negatives'])
+train_feed = prefetch.Prefetcher(next_batch, depth=4, get_state=data_state)
 
 with tf.Session(graph=graph) as session:
     tf.initialize_all_variables().run()
     print 'Initialized'
     average_loss = 0
-    for step in xrange(num_steps):
-        batch_data, batch_labels = generate_batch(batch_size, num_skips, skip_window)
-        feed_dict = {train_dataset : batch_data, train_labels : batch_labels}
+    start_time = time.time()
+    first_step = checkpoints.restore(session)
+    for step in xrange(first_step, num_steps):
+        batch_data, batch_labels, candidates, true_expected, sampled_expected = train_feed.next()
+        feed_dict = {train_dataset : batch_data, train_labels : batch_labels,
+                     sampled_candidates : candidates, true_expected_count : true_expected,
+                     sampled_expected_count : sampled_expected}
         _, l = session.run([optimizer, loss], feed_dict=feed_dict)
-        average_loss += 1
+        average_loss += l
         if step % 2000 == 0:
             if step > 0:
                 average_loss = average_loss / 2000
             ## The average loss is an estimate of the loss over the last 2000 batches
-            print 'Average loss at step', step, ':', average_loss
+            elapsed = time.time() - start_time
+            print 'Average loss at step', step, '(%.0fs):' % elapsed, average_loss
+            ## Each trained center word stands for 1 / kept_fraction tokens of the raw corpus
+            centers = (step + 1 - first_step) * centers_per_step
+            print 'Effective tokens/second: %.0f' % (centers / kept_fraction / max(elapsed, 1e-6))
             average_loss = 0
         if step % 1000 == 0:
             sim = similarity.eval()
+            top_k = 8 # number of nearest neighbors
+            ## Only partially sort each row; the first neighbour is the word itself
+            all_nearest = neighbours.top_k(sim, top_k+1)[:, 1:]
             for i in xrange(valid_size):
                 valid_word = reverse_dictionary[valid_examples[i]]
-                top_k = 8 # number of nearest neighbors
-                nearest = (-sim[i, :]).argsort()[1:top_k+1]
+                nearest = all_nearest[i]
                 log = 'Nearest to % s:' % valid_word
                 for k in xrange(top_k):
                     close_word = reverse_dictionary[nearest[k]]
                     log = '%s %s,' % (log, close_word)
                 print log
+        if (step + 1) % checkpoint_every == 0 or step == num_steps - 1:
+            checkpoints.save(session, step + 1, train_feed.get_state())
+    train_feed.close()
+    checkpoints.close()
+    print train_feed.stats()
+    print checkpoints.stats()
     final_embeddings = normalized_embeddings.eval()
 
-num_points = 400
-tsne = TSNE(perplexity=30, n_components=2, init='pca', n_iter=5000)
-two_d_embeddings = tsne.fit_transform(final_embeddings[1:num_points+1, :])
+## Save the embeddings and vocabulary for later use without retraining
+embeddings_dir = '../../data/text8_embeddings'
+embedding_store.save(embeddings_dir, final_embeddings,
+                     [reverse_dictionary[i] for i in xrange(vocabulary_size)])
+print 'Embeddings saved to', embeddings_dir
+
+## Nearest neighbours of arbitrary words in the trained embeddings
+nearest_words = neighbours.NearestNeighbours(final_embeddings)
+query = [reverse_dictionary[i] for i in valid_examples]
+for word, nearest in sorted(nearest_words.query_words(query, dictionary, reverse_dictionary).items()):
+    print 'Nearest to %s: %s' % (word, ', '.join(nearest))
+
+## Project the whole vocabulary (except UNK) to 2-D and write the result to files, so
+## no display is needed. Only the num_labels most frequent words are annotated.
+num_labels = 400
+projection_budget = 200 # maximum number of layout epochs
+words = [reverse_dictionary[i] for i in xrange(1, vocabulary_size)]
+two_d_embeddings = projection.project(final_embeddings[1:, :], num_epochs=projection_budget)
+projection.save_coordinates('../../data/text8_projection.tsv', two_d_embeddings, words)
 
-def plot(embeddings, labels):
+def plot(embeddings, labels, filename):
     assert embeddings.shape[0] >= len(labels), 'More labels than embeddings'
     pylab.figure(figsize=(15, 15)) # in inches
+    pylab.scatter(embeddings[:, 0], embeddings[:, 1], s=1, alpha=0.3, lw=0)
     for i, label in enumerate(labels):
         x, y = embeddings[i, :]
         pylab.scatter(x, y)
         pylab.annotate(label, xy=(x, y), xytext=(5, 2), textcoords='offset points',
                        ha='right', va='bottom')
-    pylab.show()
+    pylab.savefig(filename)
+    pylab.close()
     
-words = [reverse_dictionary[i] for i in xrange(1, num_points+1)]
-plot(two_d_embeddings, words)
+plot(two_d_embeddings, words[:num_labels], '../../data/text8_projection.png')
+print 'Projection written to ../../data/text8_projection.{tsv,png}'
@@ -0,0 +1,103 @@
+'''
+Created on Oct 18, 2026
+
+Vectorized training batch generators for the word2vec models.
+
+@author: trucvietle
+'''
+
+import numpy as np
+
+class SkipGramBatcher(object):
+    '''
+    Generates (center, context) batches for the skip-gram model from an int32 corpus
+    of word ids.
+
+    Each batch covers batch_size / num_skips consecutive center words. For every center,
+    num_skips distinct context positions are drawn uniformly from the skip_window words
+    on either side, which is the same distribution of pairs as the former deque-based
+    generate_batch. The whole batch is built with array indexing, and all state (cursor
+    and random stream) lives in the instance, so several batchers can run side by side.
+    '''
+    def __init__(self, data, batch_size, num_skips, skip_window, start=0, seed=None):
+        assert batch_size % num_skips == 0
+        assert num_skips <= 2 * skip_window
+        self._data = np.asarray(data, dtype=np.int32)
+        self._data_size = self._data.shape[0]
+        self._batch_size = batch_size
+        self._num_skips = num_skips
+        self._skip_window = skip_window
+        self._num_centers = batch_size / num_skips
+        ## Offsets of the context words relative to the center: [-skip_window, skip_window] \ {0}
+        self._offsets = np.concatenate([np.arange(-skip_window, 0), np.arange(1, skip_window + 1)])
+        self._random = np.random.RandomState(seed)
+        ## Position of the first word of the next window (as data_index used to be)
+        self._cursor = start % self._data_size
+
+    def next(self):
+        '''
+        Returns the next (batch, labels) pair: int32 arrays of shape [batch_size] and
+        [batch_size, 1].
+        '''
+        centers = (self._cursor + self._skip_window + np.arange(self._num_centers)) % self._data_size
+        self._cursor = (self._cursor + self._num_centers) % self._data_size
+        if self._num_skips == len(self._offsets):
+            ## Every context word is used, no sampling needed
+            offsets = np.tile(self._offsets, (self._num_centers, 1))
+        else:
+            ## num_skips distinct offsets per center: the first columns of a random permutation
+            keys = self._random.random_sample((self._num_centers, len(self._offsets)))
+            offsets = self._offsets[np.argsort(keys, axis=1)[:, :self._num_skips]]
+        contexts = (centers[:, None] + offsets) % self._data_size
+        batch = np.repeat(self._data[centers], self._num_skips)
+        labels = self._data[contexts].reshape(self._batch_size, 1)
+        return batch, labels
+
+    def get_state(self):
+        '''
+        Cursor and random state, to resume from with set_state().
+        '''
+        return {'cursor': self._cursor, 'random': self._random.get_state()}
+
+    def set_state(self, state):
+        self._cursor = state['cursor']
+        self._random.set_state(state['random'])
+
+    def __iter__(self):
+        return self
+
+class CBOWBatcher(object):
+    '''
+    Generates (context, center) batches for the continuous bag-of-words model from an
+    int32 corpus of word ids: one example per center word, whose inputs are the
+    skip_window words on either side. Like SkipGramBatcher, batches are built with array
+    indexing and all state lives in the instance.
+    '''
+    def __init__(self, data, batch_size, skip_window, start=0):
+        self._data = np.asarray(data, dtype=np.int32)
+        self._data_size = self._data.shape[0]
+        self._batch_size = batch_size
+        self._skip_window = skip_window
+        self._offsets = np.concatenate([np.arange(-skip_window, 0), np.arange(1, skip_window + 1)])
+        ## Position of the first word of the next window
+        self._cursor = start % self._data_size
+
+    def next(self):
+        '''
+        Returns the next (contexts, labels) pair: int32 arrays of shape
+        [batch_size, 2 * skip_window] and [batch_size, 1].
+        '''
+        centers = (self._cursor + self._skip_window + np.arange(self._batch_size)) % self._data_size
+        self._cursor = (self._cursor + self._batch_size) % self._data_size
+        contexts = self._data[(centers[:, None] + self._offsets) % self._data_size]
+        labels = self._data[centers].reshape(self._batch_size, 1)
+        return contexts, labels
+
+    def get_state(self):
+        return {'cursor': self._cursor}
+
+    def set_state(self, state):
+        self._cursor = state['cursor']
+
+    def __iter__(self):
+        return self